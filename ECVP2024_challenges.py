@@ -158,12 +158,15 @@ rings = stimupy.stimuli.bullseyes.circular(
     n_rings=20
 )
 
-img = np.where(rings["ring_mask"] < 3, rings["img"], segments1["img"])
-img = np.where(rings["ring_mask"] == 10, segments2["img"], img)
-img = np.where(rings["ring_mask"] == 20, segments2["img"], img)
-
-
-
-stim_IV = {"img": img, "visual_size": rings["visual_size"]}
+# Layers in z-order (bottom first), each shown where its predicate holds
+from canvas import compose_layers
+
+stim_IV = compose_layers(
+    [
+        (segments1, None),
+        (rings, rings["ring_mask"] < 3),
+        (segments2, np.isin(rings["ring_mask"], (10, 20))),
+    ]
+)
 
 stimupy.utils.plot_stim(stim_IV)
@@ -1,17 +1,10 @@
-from pathlib import Path
+from images import checkershadow
 
-import numpy as np
-from PIL import Image
 
-image_dir = Path(__file__).parents[0]
-
-image = np.array(Image.open(image_dir / "adelson_checkershadow.bmp").convert("L"))
-mask = np.array(Image.open(image_dir / "adelson_checkershadow_mask.bmp").convert("L"))
-
-for idx, val in enumerate(np.unique(mask)):
-    mask[mask == val] = idx
-
-checkershadow = {
-    "img": image,
-    "target_mask": mask,
-}
+def __getattr__(name):
+    # image and mask are decoded on first access (see images.py), not on import
+    if name == "image":
+        return checkershadow["img"]
+    if name == "mask":
+        return checkershadow["target_mask"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
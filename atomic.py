@@ -0,0 +1,51 @@
+"""
+Atomic writes for the on-disk caches (slides.py, images.py, stimcache.py,
+stimspace.py).
+
+Files and directories are written under a temporary name next to their target
+and renamed into place once complete, so readers (also in other processes)
+never see a half-written file. Temporary names start with "." and the target's
+name; a crashed writer leaves only such a temporary behind.
+
+    with atomic_write(path) as f:
+        np.save(f, array)
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+
+@contextmanager
+def atomic_write(path):
+    # Yields a binary file that replaces path when the block completes
+    path = Path(path)
+    f = tempfile.NamedTemporaryFile(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp", delete=False
+    )
+    try:
+        with f:
+            yield f
+        os.replace(f.name, path)
+    except BaseException:
+        Path(f.name).unlink(missing_ok=True)
+        raise
+
+
+@contextmanager
+def atomic_directory(path):
+    # Yields a directory that is renamed to path when the block completes. If
+    # another process created path first, that one is kept
+    path = Path(path)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{path.name}.", dir=path.parent))
+    try:
+        yield tmp
+        try:
+            os.rename(tmp, path)
+        except OSError:
+            if not path.exists():
+                raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
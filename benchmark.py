@@ -0,0 +1,137 @@
+"""
+Benchmark the generators in stimuli.py over a ladder of ppd and n_surrounds.
+
+Every function is timed on a cold stimulus cache (best of --repeat runs), and
+its peak memory is measured in a separate run with tracemalloc. Results are
+written to JSON; with --compare they are checked against such a baseline:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import stimupy
+
+import stimuli
+
+FUNCTIONS = [*stimuli.__all__, "cross_polarity", "separation_mask", "gen_all"]
+PPDS = (36, 72, 144, 300)
+N_SURROUNDS = (3, 5, 7)
+
+
+def _call(name, ppd, n_surrounds):
+    stimuli.cache_clear()
+    return getattr(stimuli, name)(ppd=ppd, n_surrounds=n_surrounds)
+
+
+def measure(name, ppd, n_surrounds, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _call(name, ppd, n_surrounds)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        _call(name, ppd, n_surrounds)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"time": min(times), "peak_memory": peak}
+
+
+def run(functions=FUNCTIONS, ppds=PPDS, n_surrounds=N_SURROUNDS, repeat=3, verbose=True):
+    results = {}
+    for name in functions:
+        for ppd in ppds:
+            for n in n_surrounds:
+                key = f"{name}|ppd={ppd}|n_surrounds={n}"
+                try:
+                    results[key] = measure(name, ppd, n, repeat=repeat)
+                except Exception as e:  # some generators do not support every n_surrounds
+                    results[key] = {"error": f"{type(e).__name__}: {e}"}
+                if verbose:
+                    print(_format(key, results[key]), flush=True)
+
+    stimuli.cache_clear()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "stimupy": stimupy.__version__,
+            "machine": platform.machine(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=0.2):
+    # Entries slower, or using more memory, than baseline * (1 + threshold),
+    # and entries that fail now but did not in the baseline
+    regressions = []
+    for key, result in results["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None or "error" in reference:
+            continue
+        if "error" in result:
+            regressions.append((key, "error", None, result["error"], None))
+            continue
+        for metric in ("time", "peak_memory"):
+            ratio = result[metric] / reference[metric] if reference[metric] else 1.0
+            if ratio > 1 + threshold:
+                regressions.append((key, metric, reference[metric], result[metric], ratio))
+    return regressions
+
+
+def _format(key, result):
+    if "error" in result:
+        return f"{key:<55} {result['error']}"
+    return f"{key:<55} {result['time'] * 1e3:10.1f} ms {result['peak_memory'] / 2**20:10.1f} MiB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--functions", nargs="+", default=FUNCTIONS)
+    parser.add_argument("--ppd", nargs="+", type=int, default=PPDS)
+    parser.add_argument("--n-surrounds", nargs="+", type=int, default=N_SURROUNDS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed relative slowdown (default: 0.2)"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.functions, args.ppd, args.n_surrounds, repeat=args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, threshold=args.threshold)
+        for key, metric, reference, value, ratio in regressions:
+            if metric == "error":
+                print(f"REGRESSION {key} fails: {value}")
+            else:
+                print(f"REGRESSION {key} {metric}: {reference:.4g} -> {value:.4g} ({ratio:.2f}x)")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
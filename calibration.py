@@ -0,0 +1,118 @@
+"""
+Monitor calibration: linearize stimulus intensities with a measured table.
+
+Intensities in stimuli.py are linear in luminance (0: darkest, 1: brightest
+luminance of the monitor), but the monitor's response to DAC values is not.
+A Calibration inverts a measured DAC -> luminance table once, into a lookup
+table from quantized intensities (0 .. 2**bit_depth - 1) to DAC values.
+Applying it is a single integer gather (np.take), which can write into a
+caller-supplied buffer, fast enough for every frame of a crossfade:
+
+    calibration = Calibration.load("calibration.csv", dtype=float)
+    stim = stimuli.sbc(calibration=calibration)   # one-off generation
+    frame = calibration(crossfade.frame(t), out=buffer)
+
+The table file has two columns, DAC value and measured luminance, separated
+by whitespace or commas; lines that do not start with a number (headers,
+comments) are skipped. DAC values are integers (e.g. 0 .. 255) or already
+normalized to [0, 1].
+"""
+
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+def _levels(bit_depth):
+    return 2**bit_depth - 1
+
+
+class Calibration:
+    def __init__(self, dac, luminance, bit_depth=8, dtype=np.uint8, out_bit_depth=None):
+        # dac, luminance: the measured table. bit_depth: quantization of the
+        # input intensities. dtype/out_bit_depth: the DAC values returned,
+        # as in stimuli.quantize (float: DAC values normalized to [0, 1])
+        dac = np.asarray(dac, dtype=float)
+        luminance = np.asarray(luminance, dtype=float)
+        if dac.shape != luminance.shape or dac.ndim != 1 or len(dac) < 2:
+            raise ValueError("dac and luminance must be 1D tables of the same length (>= 2)")
+        if dac.max() > 1:
+            dac = dac / _levels(int(np.ceil(np.log2(dac.max() + 1))))
+
+        order = np.argsort(dac)
+        dac = dac[order]
+        # Measurement noise can make the response locally non-monotonic
+        luminance = np.maximum.accumulate(luminance[order])
+        if luminance[-1] <= luminance[0]:
+            raise ValueError("measured luminance does not increase with the DAC value")
+
+        self.dac = dac
+        self.luminance = luminance
+        self.bit_depth = bit_depth
+        self.index_dtype = np.uint8 if bit_depth <= 8 else np.uint16
+
+        # Linear in luminance between the darkest and brightest measurement
+        intensities = np.linspace(0.0, 1.0, _levels(bit_depth) + 1)
+        targets = luminance[0] + intensities * (luminance[-1] - luminance[0])
+        levels = np.interp(targets, luminance, dac)
+
+        dtype = np.dtype(dtype)
+        if dtype.kind == "f":
+            self.lut = levels.astype(dtype)
+        else:
+            if out_bit_depth is None:
+                out_bit_depth = dtype.itemsize * 8
+            self.lut = np.rint(levels * _levels(out_bit_depth)).astype(dtype)
+        self._local = threading.local()
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        rows = []
+        for line in Path(path).read_text().splitlines():
+            fields = line.replace(",", " ").split()
+            try:
+                rows.append([float(field) for field in fields[:2]])
+            except ValueError:
+                continue
+        table = np.array([row for row in rows if len(row) == 2])
+        if not len(table):
+            raise ValueError(f"No (DAC, luminance) rows in {path}")
+        return cls(table[:, 0], table[:, 1], **kwargs)
+
+    @property
+    def dtype(self):
+        return self.lut.dtype
+
+    def __getstate__(self):
+        # The per-thread scratch buffers are not pickled (process executors)
+        return {key: value for key, value in self.__dict__.items() if key != "_local"}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _local=threading.local())
+
+    def index(self, img):
+        # Quantize intensities [0, 1] to lookup indices (clipped, ties to even)
+        img = np.asarray(img)
+        levels = _levels(self.bit_depth)
+        if img.dtype.kind in "ui":
+            return img
+        if img.ndim == 0:
+            return np.rint(np.clip(img, 0.0, 1.0) * levels).astype(self.index_dtype)
+
+        # Reused (per thread and shape) so that per-frame calls do not allocate
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None or scratch[0].shape != img.shape:
+            scratch = np.empty(img.shape), np.empty(img.shape, dtype=self.index_dtype)
+            self._local.scratch = scratch
+        values, index = scratch
+        np.clip(img, 0.0, 1.0, out=values)
+        np.multiply(values, levels, out=values)
+        np.rint(values, out=values)
+        index[...] = values
+        return index
+
+    def __call__(self, img, out=None):
+        # DAC values for img: intensities [0, 1], or already quantized to
+        # bit_depth (unsigned ints, clipped to the table)
+        return np.take(self.lut, self.index(img), out=out, mode="clip")
@@ -0,0 +1,224 @@
+"""
+Canvas compositor: place stimuli into one preallocated frame.
+
+Padding a stimulus (stimupy.utils.pad_dict_to_shape) or stacking stimuli
+(stimupy.utils.stack_dicts) copies the image and all masks at every step. A
+Canvas allocates the final frame once and writes each stimulus into a slice
+view at its offset; a nested layout is resolved to offsets first, so the
+pixels are written exactly once. Masks are optional, and relabelled on
+placement so their indices stay unique (as in stack_dicts).
+
+compose_layers() overlays same-sized stimuli in z-order instead, each layer
+shown where its predicate (mask) holds.
+
+    stim = pad(stimuli.sbc(), shape=(768, 1024), pad_value=0.3)
+    mosaic = compose([[s3, s7, s10], [s14, s15, s16]])
+    layered = compose_layers([(segments, None), (rings, rings["ring_mask"] < 3)])
+"""
+
+import itertools
+
+import numpy as np
+
+
+def _img(stim):
+    return stim["img"] if isinstance(stim, dict) else stim
+
+
+def centered_offset(shape, inner_shape):
+    # Same split as stimupy's padding: the extra pixel goes after
+    return tuple((size - inner) // 2 for size, inner in zip(shape, inner_shape))
+
+
+class Canvas:
+    def __init__(self, shape, fill_value=0.0, dtype=float, masks=False):
+        self.img = np.full(shape, fill_value, dtype=dtype)
+        self.masks = {}  # mask key -> mask frame, allocated on first use
+        self.with_masks = masks
+        self._max_labels = {}
+
+    @property
+    def shape(self):
+        return self.img.shape
+
+    def region(self, offset, shape):
+        return tuple(slice(start, start + size) for start, size in zip(offset, shape))
+
+    def place(self, stim, offset=None, relabel=True):
+        # Write stim (dict or image) at offset (default: centered); returns offset
+        img = _img(stim)
+        if offset is None:
+            offset = centered_offset(self.shape, img.shape)
+        if any(
+            start < 0 or start + size > total
+            for start, size, total in zip(offset, img.shape, self.shape)
+        ):
+            raise ValueError(
+                f"stimulus of shape {img.shape} at {offset} exceeds canvas {self.shape}"
+            )
+
+        region = self.region(offset, img.shape)
+        self.img[region] = img
+
+        if self.with_masks and isinstance(stim, dict):
+            for key, mask in stim.items():
+                if key.endswith("mask") and isinstance(mask, np.ndarray):
+                    self._place_mask(key, mask, region, relabel)
+
+        return offset
+
+    def _place_mask(self, key, mask, region, relabel):
+        if key not in self.masks:
+            self.masks[key] = np.zeros(self.shape, dtype=int)
+            self._max_labels[key] = 0
+
+        view = self.masks[key][region]
+        offset = self._max_labels[key] if relabel else 0
+        view[...] = 0
+        np.add(mask, offset, out=view, where=mask != 0, casting="unsafe")
+        if mask.size:
+            self._max_labels[key] = max(self._max_labels[key], int(mask.max()) + offset)
+
+    def stim(self):
+        return {"img": self.img, **self.masks, "shape": self.shape}
+
+
+# %% Layouts
+def grid_layout(shapes):
+    # shapes: rows of stimulus shapes. Rows are stacked vertically, the cells
+    # of a row horizontally; each stimulus is centered in its cell.
+    # Returns (total shape, rows of offsets)
+    row_heights = [max(shape[0] for shape in row) for row in shapes]
+    row_widths = [sum(shape[1] for shape in row) for row in shapes]
+    total = (sum(row_heights), max(row_widths))
+
+    offsets = []
+    top = 0
+    for row, height, width in zip(shapes, row_heights, row_widths):
+        left = (total[1] - width) // 2
+        row_offsets = []
+        for shape in row:
+            row_offsets.append((top + (height - shape[0]) // 2, left))
+            left += shape[1]
+        offsets.append(row_offsets)
+        top += height
+    return total, offsets
+
+
+def compose(grid, fill_value=0.0, dtype=float, masks=False):
+    # One canvas for a grid (rows of stimuli), see grid_layout
+    shape, offsets = grid_layout([[_img(stim).shape for stim in row] for row in grid])
+    canvas = Canvas(shape, fill_value=fill_value, dtype=dtype, masks=masks)
+    for row, row_offsets in zip(grid, offsets):
+        for stim, offset in zip(row, row_offsets):
+            canvas.place(stim, offset)
+    return canvas.stim()
+
+
+def pad(stim, shape, pad_value=0.0, dtype=float, masks=False):
+    canvas = Canvas(shape, fill_value=pad_value, dtype=dtype, masks=masks)
+    canvas.place(stim)
+    return canvas.stim()
+
+
+# %% Layers
+# A layered stimulus: layers (source, predicate) in z-order, bottom first. A
+# layer shows its source where its predicate holds: a boolean array, a
+# function of the layer's stimulus returning one, or None (everywhere). The
+# topmost layer of every pixel is resolved once, into a small integer map
+# (0: background) and the flat pixel positions of each layer. The image and
+# every mask are then gathered from their layers in one pass each, instead of
+# one full-frame np.where per layer.
+# A source may also be a function returning the stimulus: it is only called
+# if its layer is needed (e.g. not for a layer that is covered everywhere).
+class _Layer:
+    def __init__(self, source, predicate):
+        self.source = source
+        self.predicate = predicate
+        self._stim = None
+
+    @property
+    def stim(self):
+        if self._stim is None:
+            self._stim = self.source() if callable(self.source) else self.source
+        return self._stim
+
+    def where(self):
+        if callable(self.predicate):
+            return np.asarray(self.predicate(self.stim), dtype=bool)
+        return np.asarray(self.predicate, dtype=bool)
+
+
+def layer_index(layers, shape):
+    # Per-pixel index of the topmost layer whose predicate holds (0: none)
+    index = np.zeros(shape, dtype=np.uint8 if len(layers) < 2**8 else np.uint16)
+    # Layers below the topmost unconditional one are hidden everywhere
+    first = max([k for k, layer in enumerate(layers) if layer.predicate is None], default=0)
+    for k, layer in enumerate(layers[first:], start=first + 1):
+        if layer.predicate is None:
+            index.fill(k)
+        else:
+            np.copyto(index, k, where=layer.where())
+    return index
+
+
+def _gather(positions, choices, shape, offsets=None, dtype=None):
+    # Each choice (array or scalar) at its layer's flat positions; nonzero
+    # values are shifted by the layer's offset (mask labels)
+    dtype = np.result_type(*choices) if dtype is None else dtype
+    out = np.empty(int(np.prod(shape)), dtype=dtype)
+    for k, (where, choice) in enumerate(zip(positions, choices)):
+        if not len(where):
+            continue
+        if np.ndim(choice) == 0:
+            out[where] = choice
+            continue
+        values = np.take(choice, where).astype(dtype, copy=False)
+        if offsets is not None and offsets[k]:
+            values[values != 0] += offsets[k]
+        out[where] = values
+    return out.reshape(shape)
+
+
+def compose_layers(layers, background=0.0, shape=None, relabel=True):
+    # Returns a stimulus dict with img, the composed masks (labels offset per
+    # layer if relabel, as in Canvas) and layer_mask (the layer index map)
+    layers = [_Layer(source, predicate) for source, predicate in layers]
+    if shape is None:
+        known = [layer.predicate for layer in layers if isinstance(layer.predicate, np.ndarray)]
+        known += [_img(layer.source) for layer in layers if not callable(layer.source)]
+        shape = known[0].shape if known else _img(layers[-1].stim).shape
+    shape = tuple(shape)
+
+    index = layer_index(layers, shape)
+    flat_index = index.ravel()
+    positions = [np.flatnonzero(flat_index == k) for k in range(len(layers) + 1)]
+    stims = [layer.stim if len(where) else None for layer, where in zip(layers, positions[1:])]
+    for stim in stims:
+        if stim is not None and _img(stim).shape != shape:
+            raise ValueError(f"layer of shape {_img(stim).shape} does not match {shape}")
+
+    imgs = [0 if stim is None else _img(stim) for stim in stims]
+    composed = {"img": _gather(positions, [background, *imgs], shape)}
+
+    stims = [stim if isinstance(stim, dict) else {} for stim in stims]
+    mask_keys = sorted({key for stim in stims for key in stim if key.endswith("mask")})
+    for key in mask_keys:
+        masks = [stim.get(key, 0) for stim in stims]
+        offsets = None
+        dtype = np.result_type(*masks)
+        if relabel:
+            # Labels of each layer start past those of the layers below, in
+            # a dtype that holds them all (masks may be as small as uint8)
+            max_labels = [int(np.max(mask)) for mask in masks]
+            offsets = [0, 0, *itertools.accumulate(max_labels[:-1])]
+            dtype = np.result_type(dtype, np.min_scalar_type(sum(max_labels)))
+        composed[key] = _gather(positions, [0, *masks], shape, offsets=offsets, dtype=dtype)
+
+    composed["layer_mask"] = index
+    for stim in stims:
+        for key in ("visual_size", "ppd"):
+            if key in stim:
+                composed.setdefault(key, stim[key])
+    composed["shape"] = shape
+    return composed
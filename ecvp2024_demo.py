@@ -3,283 +3,194 @@ Created on Mon Aug 26 15:59:44 2024
 @author: lynnschmittwilken
 """
 
-from PIL import Image
+import atexit
+import os
 import numpy as np
-from hrl import HRL
-import stimuli
-from stimupy.utils import pad_dict_to_shape, flip_dict, stack_dicts
+import slides as slide_bundle
+from calibration import Calibration
+from frametiming import FrameTimer
+from textures import TexturePool, hrl_upload
+from presenter import HRLInput, Presenter, Slide
+from transitions import Crossfade, Prefetcher, Still, format_timing
 
 
 # %% Prepare
+meta, slides = slide_bundle.load()
+
 WIDTH, HEIGHT = 1920, 1080             # monitor specs
 coords = [WIDTH / 2.0, HEIGHT / 2.0]   # center coords
 rate = 60                              # frame rate
 nframes = int(1. * rate)              # duration of transitions in frames
-fade = np.linspace(0, 1, nframes)      # linear fading
+easing = "linear"                      # fading curve, see transitions.EASINGS
+frameBuffer = np.empty((768, 1024))    # reused for every transition frame
+
+# Frame timing: set DEMO_TIMING=timing.json (or .csv) to record and export it
+timingFile = os.environ.get("DEMO_TIMING")
+timer = FrameTimer(rate=rate, enabled=bool(timingFile))
+if timingFile:
+    atexit.register(timer.export, timingFile)
 
-# Create HRL object
-hrl = HRL(
-    graphics='gpu',
-    inputs='keyboard',
-    wdth=WIDTH,
-    hght=HEIGHT,
-    bg=stimuli.INTENSITY_BACKGROUND,
-    # fs=False,
-    )
+# Monitor calibration: set DEMO_CALIBRATION=calibration.csv (DAC, luminance) to
+# linearize every frame with it (then do not also give HRL a lookup table)
+calibrationFile = os.environ.get("DEMO_CALIBRATION")
+calibration = Calibration.load(calibrationFile, dtype=float) if calibrationFile else None
+calibratedFrames = {}                  # shape -> reused calibrated frame
 
 
 # %% Stimuli
+# Prebuilt by slides.py, mapped from slides.bundle (rebuilt only if stimuli.py changed)
 
 ############ Natural image
-s0 = np.array(Image.open("natural_scene_kingdom2011.png").convert("L")) / 255
+s0 = slides["s0"]
 
 ############# Simplify
-# sbc black
-s1 = stimuli.sbc(contexts=["black","background"], intensity_contexts={
-    "black": 0.0,
-    "background": stimuli.INTENSITY_BACKGROUND,
-    "white": 1.0,
-}, intensity_targets=(0.5, stimuli.INTENSITY_BACKGROUND))
-s1 = pad_dict_to_shape(s1, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
-
-# sbc white
-s2 = stimuli.sbc(contexts=["background","white"], intensity_contexts={
-    "black": 0.0,
-    "background": stimuli.INTENSITY_BACKGROUND,
-    "white": 1.0,
-}, intensity_targets=(stimuli.INTENSITY_BACKGROUND, 0.5))
-s2 = pad_dict_to_shape(s2, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
-
-# sbc full
-s3 = pad_dict_to_shape(stimuli.sbc(), shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
+s1 = slides["s1"]  # sbc black
+s2 = slides["s2"]  # sbc white
+s3 = slides["s3"]  # sbc full
 
 ############# Context effects
 # sbc small
-s4 = stimuli.sbc_separate()
-s4 = pad_dict_to_shape(s4, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
-s5 = stimuli.sbc_smallest()
-s5 = pad_dict_to_shape(s5, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
+s4 = slides["s4"]
+s5 = slides["s5"]
+s5_flipped = slides["s5_flipped"]
 
 # bullseye
-s6 = stimuli.bullseye_separate()
-s6 = pad_dict_to_shape(s6, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
-s7 = stimuli.bullseye_high_freq()
-s7 = pad_dict_to_shape(s7, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
+s6 = slides["s6"]
+s7 = slides["s7"]
 
 # checkerboard
-s7_ = stimuli.cross()
-s7_ = pad_dict_to_shape(s7_, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
-s8 = stimuli.checkerboard_smallest()
-s8 = pad_dict_to_shape(s8, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
-s9 = stimuli.checkerboard_separate()
-s9 = pad_dict_to_shape(s9, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
-s10 = stimuli.checkerboard()
-s10 = pad_dict_to_shape(s10, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
+s7_ = slides["s7_"]
+s8 = slides["s8"]
+s9 = slides["s9"]
+s10 = slides["s10"]
 
 # White's
-s11 = stimuli.cross_polarity()
-s11 = pad_dict_to_shape(s11, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
+s11 = slides["s11"]
+s12 = slides["s12"]
+s14 = slides["s14"]
+s15 = slides["s15"]
+s16 = slides["s16"]
 
-s12 = stimuli.whites_separate()
-s12= pad_dict_to_shape(s12, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
+sStack = slides["sStack"]
+sStackHalf = slides["sStack_half"]  # half resolution, area-averaged
 
-s14 = stimuli.whites()
-s14 = pad_dict_to_shape(s14, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
 
-s15 = stimuli.whitesLong()
-s15 = pad_dict_to_shape(s15, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
 
-s16 = stimuli.whiteHowe()
-s16 = pad_dict_to_shape(s16, shape=(768, 1024), pad_value=stimuli.INTENSITY_BACKGROUND)
-
-sStack1 = stack_dicts(stack_dicts(s3, s7, keys="img"), s10, keys="img")
-sStack2 = stack_dicts(stack_dicts(s14, s15, keys="img"), s16, keys="img")
-sStack = stack_dicts(sStack1, sStack2, "vertical", keys="img")
-
-
-
-# %% Functions
-def starter():
-    stimTex = presentStim(s0)
-    return stimTex
-
-def finisher():
-    stimTex = presentStim(sStack["img"][::2, ::2])
-    return stimTex
+# %% Slides
+# One image: shown still; two images: crossfade from the first to the second
+starter = Slide("starter", s0)
+finisher = Slide("finisher", sStackHalf)
 
 ############# SBCs
-def sbcBlack():
-    stimTex = presentStim(s1["img"])
-    return stimTex
-
-def sbcWhite():
-    stimTex = presentStim(s2["img"])
-    return stimTex
-
-def sbcFull():
-    stimTex = presentStim(s3["img"])
-    return stimTex
-
-def sbcSmaller():
-    for t in range(int(nframes)):
-        stim = s3["img"] * (1-fade[t]) + s4["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def sbcSmallest():
-    for t in range(int(nframes)):
-        stim = s4["img"] * (1-fade[t]) + s5["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
+sbcBlack = Slide("sbcBlack", s1)
+sbcWhite = Slide("sbcWhite", s2)
+sbcFull = Slide("sbcFull", s3)
+sbcSmaller = Slide("sbcSmaller", s3, s4)
+sbcSmallest = Slide("sbcSmallest", s4, s5)
 
 ############# Bullseyes
-def bullseyeSmall():
-    for t in range(int(nframes)):
-        stim = s5["img"] * (1-fade[t]) + s6["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def bullseye():
-    for t in range(int(nframes)):
-        stim = s6["img"] * (1-fade[t]) + s7["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def bullseyeSmallest():
-    for t in range(int(nframes)):
-        stim = s7["img"] * (1-fade[t]) + s5["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
+bullseyeSmall = Slide("bullseyeSmall", s5, s6)
+bullseye = Slide("bullseye", s6, s7)
+bullseyeSmallest = Slide("bullseyeSmallest", s7, s5)
 
 ############# Checkerboard
-def cross():
-    for t in range(int(nframes)):
-        stim = s5["img"] * (1-fade[t]) + s7_["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def checkSmall():
-    for t in range(int(nframes)):
-        stim = s7_["img"] * (1-fade[t]) + s8["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def check():
-    for t in range(int(nframes)):
-        stim = s8["img"] * (1-fade[t]) + s9["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def checkFull():
-    for t in range(int(nframes)):
-        stim = s9["img"] * (1-fade[t]) + s10["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
+cross = Slide("cross", s5, s7_)
+checkSmall = Slide("checkSmall", s7_, s8)
+check = Slide("check", s8, s9)
+checkFull = Slide("checkFull", s9, s10)
 
 ############# Whites
-def cross2():
-    for t in range(int(nframes)):
-        stim = s10["img"] * (1-fade[t]) + s7_["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def crossPol():
-    for t in range(int(nframes)):
-        stim = s7_["img"] * (1-fade[t]) + s11["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def white():
-    for t in range(int(nframes)):
-        stim = s11["img"] * (1-fade[t]) + s12["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def whiteFull():
-    for t in range(int(nframes)):
-        stim = s12["img"] * (1-fade[t]) + s14["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def whiteLong():
-    for t in range(int(nframes)):
-        stim = s14["img"] * (1-fade[t]) + s15["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def whiteHowe():
-    for t in range(int(nframes)):
-        stim = s15["img"] * (1-fade[t]) + s16["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
-def sbcSmall():
-    for t in range(int(nframes)):
-        stim = s16["img"] * (1-fade[t]) + flip_dict(s5)["img"] * fade[t]
-        stimTex = presentStim(stim)
-    return stimTex
-
+cross2 = Slide("cross2", s10, s7_)
+crossPol = Slide("crossPol", s7_, s11)
+white = Slide("white", s11, s12)
+whiteFull = Slide("whiteFull", s12, s14)
+whiteLong = Slide("whiteLong", s14, s15)
+whiteHowe = Slide("whiteHowe", s15, s16)
+sbcSmall = Slide("sbcSmall", s16, s5_flipped)
+
+slideSequence = [
+    starter,
+    sbcBlack, sbcWhite, sbcFull, sbcSmaller, sbcSmallest,  # sbc
+    bullseyeSmall, bullseye, bullseyeSmallest,             # bullseye
+    cross, checkSmall, check, checkFull,                   # checkerboard
+    cross2, crossPol, white, whiteFull, whiteLong,         # Whites
+    whiteHowe, sbcSmall,                                   # return
+    finisher,
+    ]
 
 
 ############# Helper functions
+def prepareSlide(slide):
+    if len(slide.images) == 1:
+        return Still(*slide.images)
+    return Crossfade(*slide.images, nframes, easing=easing, out=frameBuffer)
+
+def reportTiming(transition):
+    if isinstance(transition, Crossfade):
+        timing = transition.timing(rate)
+        if timing["over_budget"]:
+            print(format_timing(timing))
+
+def calibrate(stimArr):
+    out = calibratedFrames.get(stimArr.shape)
+    if out is None:
+        out = calibratedFrames[stimArr.shape] = np.empty(stimArr.shape)
+    return calibration(stimArr, out=out)
+
 def presentStim(stimArr):
-    # Create texture
-    stimTex = hrl.graphics.newTexture(stimArr)
+    # Linearize
+    if calibration is not None:
+        with timer.stage("calibrate"):
+            stimArr = calibrate(stimArr)
+
+    # Get (reused) texture
+    with timer.stage("texture"):
+        stimTex = textures.acquire(stimArr)
     
     # Draw texture
-    stimTex.draw((coords[0] - stimTex.wdth/2, coords[1] - stimTex.hght/2))
-    hrl.graphics.flip(clr=True)
+    with timer.stage("draw"):
+        stimTex.draw((coords[0] - stimTex.wdth/2, coords[1] - stimTex.hght/2))
+    with timer.stage("flip"):
+        hrl.graphics.flip(clr=True)
+    timer.end_frame()
+    textures.trim()
     return stimTex
 
 
 # %% Execute
+# Without HRL (e.g. in CI), render the sequence to a file: see render_offline.py
 if __name__ == '__main__':
-    stimFuncs = [
-        starter,
-        sbcBlack, sbcWhite, sbcFull, sbcSmaller, sbcSmallest,  # sbc
-        bullseyeSmall, bullseye, bullseyeSmallest,             # bullseye
-        cross, checkSmall, check, checkFull,                   # checkerboard
-        cross2, crossPol, white, whiteFull, whiteLong,         # Whites
-        whiteHowe, sbcSmall,                                   # return
-        finisher, starter,
-        ]
-    idx = 0
-    
-    # Display first stimulus
-    stimTex = stimFuncs[idx]()
-    
-    # Continue displaying
-    while True:
-        (btn,t1) = hrl.inputs.readButton()
-        
-        if btn == 'Space':
-            break
-        
-        elif btn == 'Right':
-            idx += 1
-            idx = idx % (len(stimFuncs)-1)
-            stimTex.delete()
-            stimTex = stimFuncs[idx]()
-            
-        elif btn == 'Left':
-            idx -= 1
-            idx = idx % (len(stimFuncs)-1)
-            stimTex.delete()
-            stimTex = stimFuncs[idx]()
-
-
-    stimTex.delete()
+    from hrl import HRL
+
+    # Create HRL object
+    hrl = HRL(
+        graphics='gpu',
+        inputs='keyboard',
+        wdth=WIDTH,
+        hght=HEIGHT,
+        bg=meta["intensity_background"],
+        # fs=False,
+        )
+    # reused textures, updated in place, released on exit
+    textures = TexturePool(hrl.graphics, upload=hrl_upload(hrl.graphics))
+    atexit.register(textures.release)
+
+    # Right/Left/Space are read between frames, so they can skip or reverse a
+    # running fade; the fades next to the current slide are prepared while it
+    # is shown
+    presenter = Presenter(
+        slideSequence,
+        prepare=prepareSlide,
+        present=presentStim,
+        inputs=HRLInput(hrl.inputs),
+        prefetcher=Prefetcher(prepareSlide),
+        timer=timer,
+        finished=reportTiming,
+        )
+    latencies = presenter.run()
+    if latencies:
+        # From when a key was received: a lower bound, up to one frame short
+        print(f"key-to-first-frame latency: >= {1e3 * max(l for _, l in latencies):.1f} ms max")
+
+    textures.release()
     hrl.close()
-
-
@@ -0,0 +1,155 @@
+"""
+Opt-in frame timing for the demo's render path.
+
+A FrameTimer records, for every presented frame, when each stage (calibrate,
+texture, draw, flip) started and ended, grouped by transition. Frames whose flip
+came more than one refresh interval after the previous flip are counted as
+dropped frames. Per-transition stage histograms can be exported to JSON
+(including the raw per-frame timestamps) or CSV:
+
+    timer = FrameTimer(rate=60)
+    timer.start_transition("sbcSmaller")
+    with timer.stage("texture"):
+        ...
+    timer.end_frame()
+    timer.export("timing.json")
+
+A disabled FrameTimer records nothing, at (almost) no cost.
+"""
+
+import csv
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import numpy as np
+
+STAGES = ("calibrate", "texture", "draw", "flip")
+HISTOGRAM_BINS = np.append(np.arange(0, 51, 1.0), np.inf)  # ms
+
+
+class FrameTimer:
+    def __init__(self, rate=60, enabled=True, clock=time.perf_counter):
+        self.rate = rate
+        self.enabled = enabled
+        self.clock = clock
+        self.transitions = []
+        self._frame = {}
+
+    def start_transition(self, name):
+        if self.enabled:
+            self.transitions.append({"name": name, "frames": []})
+            self._frame = {}
+
+    def stage(self, name):
+        if not self.enabled:
+            return nullcontext()
+        return self._stage(name)
+
+    @contextmanager
+    def _stage(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self._frame[name] = (start, self.clock())
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        if not self.transitions:
+            self.start_transition(None)
+        self.transitions[-1]["frames"].append(self._frame)
+        self._frame = {}
+
+    # %% Analysis
+    def flip_intervals(self, transition):
+        flips = [frame["flip"][1] for frame in transition["frames"] if "flip" in frame]
+        return np.diff(flips)
+
+    def dropped_frames(self, transition):
+        # Refresh intervals missed between consecutive flips of a transition
+        missed = np.round(self.flip_intervals(transition) * self.rate) - 1
+        return int(np.clip(missed, 0, None).sum())
+
+    def stage_durations(self, transition, stage):
+        return np.array(
+            [frame[stage][1] - frame[stage][0] for frame in transition["frames"] if stage in frame]
+        )
+
+    def summary(self):
+        summary = []
+        for transition in self.transitions:
+            stages = {}
+            for stage in STAGES:
+                durations = self.stage_durations(transition, stage) * 1e3
+                counts, _ = np.histogram(durations, bins=HISTOGRAM_BINS)
+                stages[stage] = {
+                    "mean_ms": float(durations.mean()) if durations.size else None,
+                    "max_ms": float(durations.max()) if durations.size else None,
+                    "histogram": counts.tolist(),
+                }
+            summary.append(
+                {
+                    "name": transition["name"],
+                    "frames": len(transition["frames"]),
+                    "dropped_frames": self.dropped_frames(transition),
+                    "stages": stages,
+                }
+            )
+        return summary
+
+    # %% Export
+    def export(self, path):
+        path = Path(path)
+        if path.suffix == ".csv":
+            self._export_csv(path)
+        else:
+            self._export_json(path)
+
+    def _export_json(self, path):
+        data = {
+            "rate": self.rate,
+            "histogram_bins_ms": [edge if np.isfinite(edge) else None for edge in HISTOGRAM_BINS],
+            "transitions": self.summary(),
+            "frames": [
+                [{stage: list(times) for stage, times in frame.items()} for frame in t["frames"]]
+                for t in self.transitions
+            ],
+        }
+        with open(path, "w") as f:
+            json.dump(data, f, indent=1)
+
+    def _export_csv(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(
+                [
+                    "transition",
+                    "name",
+                    "frames",
+                    "dropped_frames",
+                    "stage",
+                    "bin_start_ms",
+                    "bin_end_ms",
+                    "count",
+                ]
+            )
+            for idx, transition in enumerate(self.summary()):
+                for stage, stats in transition["stages"].items():
+                    for start, end, count in zip(
+                        HISTOGRAM_BINS[:-1], HISTOGRAM_BINS[1:], stats["histogram"]
+                    ):
+                        writer.writerow(
+                            [
+                                idx,
+                                transition["name"],
+                                transition["frames"],
+                                transition["dropped_frames"],
+                                stage,
+                                start,
+                                end,
+                                count,
+                            ]
+                        )
@@ -0,0 +1,137 @@
+"""
+Image stimuli (adelson_checkershadow, the natural scene), loaded lazily.
+
+An ImageStimulus is a read-only mapping (img, and target_mask if it has a
+mask image) that decodes its files on first access, not on import. The mask
+is relabelled in one pass: its unique values, in increasing order, become the
+labels 0, 1, 2, ... The decoded arrays are cached as .npy files, keyed by a
+hash of the image files, and memory-mapped (read-only) from the cache next
+time, so the images are only decoded again when a file changes.
+
+    stim = ImageStimulus("adelson_checkershadow.bmp", "adelson_checkershadow_mask.bmp")
+    stim["img"], stim["target_mask"]
+"""
+
+import hashlib
+import os
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+import numpy as np
+
+from atomic import atomic_write
+
+DIR = Path(__file__).parent
+# Not inside stimcache's directory: its eviction would treat this as an entry
+CACHE_DIR = Path(
+    os.environ.get("STIMULI_IMAGE_CACHE_DIR", Path.home() / ".cache" / "ecvp2024_images")
+)
+CACHE_VERSION = 1  # bump when the decoding changes
+
+
+def decode(path):
+    # Deferred: importing PIL is part of the cost we avoid on import
+    from PIL import Image
+
+    return np.array(Image.open(path).convert("L"))
+
+
+def relabel(mask):
+    # Unique values -> 0, 1, 2, ... (in increasing order), in one pass
+    _, labels = np.unique(mask, return_inverse=True)
+    return labels.reshape(mask.shape).astype(mask.dtype)
+
+
+def file_hash(*paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class ImageStimulus(Mapping):
+    def __init__(self, image, mask=None, normalize=False, cache_dir=CACHE_DIR):
+        # normalize: img as float in [0, 1] instead of the decoded uint8
+        self.image = DIR / image
+        self.mask = None if mask is None else DIR / mask
+        self.normalize = normalize
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self._stim = None
+        self._lock = threading.Lock()
+
+    def keys(self):
+        return ("img",) if self.mask is None else ("img", "target_mask")
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, key):
+        if key not in self.keys():
+            raise KeyError(key)
+        return self.load()[key]
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"ImageStimulus({self.image.name!r}, {state})"
+
+    @property
+    def is_loaded(self):
+        return self._stim is not None
+
+    def load(self):
+        with self._lock:
+            if self._stim is None:
+                key = None if self.cache_dir is None else self.key()
+                self._stim = self._load_cached(key) or self._decode(key)
+            return self._stim
+
+    def _decode(self, key=None):
+        stim = {"img": decode(self.image)}
+        if self.normalize:
+            stim["img"] = stim["img"] / 255
+        if self.mask is not None:
+            stim["target_mask"] = relabel(decode(self.mask))
+
+        if key is not None:
+            try:
+                self._store(stim, key)
+            except OSError:
+                pass  # e.g. read-only cache directory: just don't cache
+        for array in stim.values():
+            array.flags.writeable = False
+        return stim
+
+    # %% Cache
+    def key(self):
+        files = [self.image] if self.mask is None else [self.image, self.mask]
+        return f"{file_hash(*files)[:32]}_{int(self.normalize)}_v{CACHE_VERSION}"
+
+    def cache_path(self, key, name):
+        return self.cache_dir / f"{self.image.stem}_{key}_{name}.npy"
+
+    def _load_cached(self, key):
+        if key is None:
+            return None
+        try:
+            return {
+                name: np.load(self.cache_path(key, name), mmap_mode="r") for name in self.keys()
+            }
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _store(self, stim, key):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        for name, array in stim.items():
+            with atomic_write(self.cache_path(key, name)) as f:
+                np.save(f, array, allow_pickle=False)
+
+
+# %% Image stimuli
+checkershadow = ImageStimulus("adelson_checkershadow.bmp", "adelson_checkershadow_mask.bmp")
+natural_scene = ImageStimulus("natural_scene_kingdom2011.png", normalize=True)
@@ -0,0 +1,205 @@
+"""
+Event-driven presentation loop for ecvp2024_demo.py.
+
+The Presenter shows a sequence of Slides; prepare(slide) turns a slide into a
+transition with len() frames and frame(t) (transitions.Crossfade,
+transitions.Still). Input is polled between frames, so a key press takes
+effect at the next frame, also in the middle of a fade:
+
+    Right   play the next slide's transition (skips the rest of a running fade;
+            during a reversed fade: play forward again)
+    Left    reverse a running fade back to the previous slide;
+            when idle: replay the previous slide's transition
+    Space   quit
+
+For every key press, the latency from key press to its first presented frame
+is recorded. Inputs only need poll(timeout) -> (key, time of the press) or
+None, with press times on the Presenter's clock: HRLInput wraps hrl.inputs,
+ScriptedInput replays keys at given times (for testing). hrl does not
+timestamp key events, so HRLInput gives the time a key was received: a key
+pressed while a frame is drawn is only received at the next poll, and its
+latency is a lower bound (short by up to one frame). Without a display,
+`python presenter.py` runs the loop on scripted keys and headless graphics.
+"""
+
+import time
+
+
+class Slide:
+    # A named slide: one image (shown still), or two (crossfaded first to second)
+    def __init__(self, name, *images):
+        self.name = name
+        self.images = images
+
+    def __repr__(self):
+        return f"Slide({self.name!r})"
+
+
+class HRLInput:
+    # Assumes hrl's readButton(to=seconds) returns (button, seconds from the
+    # call until it received the button), or (None, ...) on timeout. Press
+    # times are when a key was received, not pressed (see above)
+    def __init__(self, inputs, clock=time.perf_counter):
+        self.inputs = inputs
+        self.clock = clock
+
+    def poll(self, timeout=0.0):
+        start = self.clock()
+        btn, t = self.inputs.readButton(to=timeout)
+        if btn is None:
+            return None
+        return btn, self.clock() if t is None else start + t
+
+
+class ScriptedInput:
+    # Replays (seconds after the first poll, key) events on clock
+    def __init__(self, events, clock=time.perf_counter, sleep=time.sleep):
+        self.events = sorted(events, key=lambda event: event[0])
+        self.clock = clock
+        self.sleep = sleep
+        self._start = None
+
+    def poll(self, timeout=0.0):
+        if self._start is None:
+            self._start = self.clock()
+        if not self.events:
+            return "Space", self.clock()
+
+        pressed = self._start + self.events[0][0]
+        wait = pressed - self.clock()
+        if wait > timeout:
+            self.sleep(timeout)
+            return None
+        self.sleep(max(wait, 0))
+        return self.events.pop(0)[1], pressed
+
+
+class Presenter:
+    def __init__(
+        self,
+        slides,
+        prepare,
+        present,
+        inputs,
+        prefetcher=None,
+        timer=None,
+        finished=None,
+        idle_poll=0.05,
+        clock=time.perf_counter,
+    ):
+        self.slides = slides
+        self.prepare = prepare if prefetcher is None else prefetcher.get
+        self.present = present
+        self.inputs = inputs
+        self.prefetcher = prefetcher
+        self.timer = timer
+        self.finished = finished
+        self.idle_poll = idle_poll
+        self.clock = clock
+
+        self.latencies = []  # (key, seconds from key press to first frame)
+        self.log = []  # (slide index, frame index) of every presented frame
+
+    def run(self, start=0):
+        n_slides = len(self.slides)
+        self.idx = start
+        self._play(start, direction=1)
+        pending = None  # (key, time of key press) awaiting its first frame
+
+        while True:
+            playing = self.direction != 0
+            event = self.inputs.poll(0.0 if playing else self.idle_poll)
+
+            if event is not None:
+                key, pressed = event
+                if key == "Space":
+                    break
+                elif key == "Right":
+                    if self.direction == -1:
+                        self.direction = 1
+                        self.t = min(self.t + 2, len(self.transition) - 1)
+                    else:
+                        self.idx = (self.idx + 1) % n_slides
+                        self._play(self.idx, direction=1)
+                    pending = (key, pressed)
+                elif key == "Left":
+                    if self.direction == 1 and self.t > 0:
+                        self.direction = -1
+                        self.t = max(self.t - 2, 0)
+                    elif self.direction == -1:
+                        self.t = 0  # skip the rest of the reversal
+                    else:
+                        self.idx = (self.idx - 1) % n_slides
+                        self._play(self.idx, direction=1)
+                    pending = (key, pressed)
+
+            if self.direction != 0:
+                self._step()
+                if pending is not None:
+                    self.latencies.append((pending[0], self.clock() - pending[1]))
+                    pending = None
+                if self.direction == 0:
+                    if self.finished is not None:
+                        self.finished(self.transition)
+                    self._prefetch_neighbours()
+
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        return self.latencies
+
+    def _play(self, idx, direction):
+        if self.timer is not None:
+            self.timer.start_transition(self.slides[idx].name)
+        self.transition = self.prepare(self.slides[idx])
+        self.direction = direction
+        self.t = 0
+
+    def _step(self):
+        # Present frame t, then advance t in the current direction
+        self.present(self.transition.frame(self.t))
+        self.log.append((self.idx, self.t))
+
+        if self.direction == 1 and self.t >= len(self.transition) - 1:
+            self.direction = 0
+        elif self.direction == -1 and self.t <= 0:
+            # Reversed back to where this slide started: the previous slide
+            self.idx = (self.idx - 1) % len(self.slides)
+            self.direction = 0
+        else:
+            self.t += self.direction
+
+    def _prefetch_neighbours(self):
+        if self.prefetcher is not None:
+            n_slides = len(self.slides)
+            self.prefetcher.prefetch(self.slides[(self.idx + step) % n_slides] for step in (1, -1))
+
+
+# %% Headless run
+if __name__ == "__main__":
+    import numpy as np
+
+    from textures import HeadlessGraphics, TexturePool
+    from transitions import Crossfade
+
+    rate = 60
+    images = [np.full((108, 192), value) for value in (0.2, 0.5, 0.8)]
+    slides = [Slide(f"s{idx}", images[idx - 1], img) for idx, img in enumerate(images)]
+    graphics = HeadlessGraphics()
+    textures = TexturePool(graphics)
+
+    def present(frame):
+        textures.acquire(frame).draw()
+        graphics.flip()
+        time.sleep(1 / rate)
+
+    # Right while idle, Left in the middle of that fade, Right again
+    presenter = Presenter(
+        slides,
+        prepare=lambda slide: Crossfade(*slide.images, rate),
+        present=present,
+        inputs=ScriptedInput([(1.2, "Right"), (1.6, "Left"), (2.4, "Right"), (3.6, "Space")]),
+    )
+    for key, latency in presenter.run():
+        print(f"{key:<6} key-to-first-frame latency: {1e3 * latency:.1f} ms")
+    print(f"{len(presenter.log)} frames, {graphics.live_textures} live textures")
+    textures.release()
@@ -0,0 +1,94 @@
+"""
+Per-region luminance statistics over label masks (target_mask, frame_mask, ...).
+
+region_stats() computes count, mean, variance (ddof=0, as np.var), min and max
+of img for every label of mask at once: the labels (offset per image) index
+np.bincount and np.minimum.at / np.maximum.at reductions, instead of one
+boolean mask per label. img and mask are single (H, W) images or batches
+(N, H, W), and are broadcast against each other, e.g. a batch of model
+outputs for one stimulus with its (H, W) target_mask:
+
+    stats = region_stats(outputs, stim["target_mask"])
+    stats["mean"][:, 1:]  # (N, n_targets) mean output per target
+
+Every statistic is an array of shape (*batch, n_labels); labels without any
+pixel have count 0 and NaN statistics.
+"""
+
+import numpy as np
+
+STATS = ("count", "mean", "var", "min", "max")
+CHUNK_PIXELS = 2**21  # pixels reduced at once
+
+
+def region_stats(img, mask, n_labels=None):
+    img = np.asarray(img)
+    mask = np.asarray(mask)
+    shape = np.broadcast_shapes(img.shape, mask.shape)
+    if len(shape) < 2:
+        raise ValueError(f"Expected (..., H, W) images, got shape {shape}")
+    if mask.dtype.kind not in "ui":
+        raise ValueError(f"mask must hold integer labels, got {mask.dtype}")
+    if mask.size and mask.min() < 0:
+        raise ValueError("mask labels must be non-negative")
+
+    max_label = int(mask.max()) if mask.size else -1
+    if n_labels is None:
+        n_labels = max_label + 1
+    elif max_label >= n_labels:
+        raise ValueError(f"mask has label {max_label}, but n_labels={n_labels}")
+
+    batch_shape = shape[:-2]
+    n_images = int(np.prod(batch_shape))
+    n_pixels = shape[-2] * shape[-1]
+    img = np.broadcast_to(img, shape).reshape(n_images, n_pixels)
+    labels = np.broadcast_to(mask, shape).reshape(n_images, n_pixels)
+    shared = mask.size == n_pixels  # one mask for all images
+
+    stats = {
+        "count": np.zeros((n_images, n_labels), dtype=np.intp),
+        **{name: np.empty((n_images, n_labels)) for name in STATS[1:]},
+    }
+    # Chunks of whole images, so the temporaries stay small (and in cache)
+    chunk = max(1, CHUNK_PIXELS // max(n_pixels, 1))
+    index = None
+    for start in range(0, n_images, chunk):
+        stop = min(start + chunk, n_images)
+        if index is None or not shared or stop - start < chunk:
+            # Label of every pixel, offset by n_labels per image: one bin
+            # per (image, label). For a shared mask this is built only once
+            index = labels[start:stop].astype(np.intp)
+            index += (np.arange(stop - start) * n_labels)[:, None]
+            index = index.ravel()
+        values = img[start:stop].reshape(-1).astype(float, copy=False)
+        for name, stat in _reduce(values, index, (stop - start) * n_labels).items():
+            stats[name][start:stop] = stat.reshape(stop - start, n_labels)
+
+    return {name: stat.reshape(*batch_shape, n_labels) for name, stat in stats.items()}
+
+
+def _reduce(values, index, n_bins):
+    count = np.bincount(index, minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(index, weights=values, minlength=n_bins) / count
+        # Deviations from the region means, not E[x**2] - E[x]**2 (cancellation)
+        deviations = values - mean[index]
+        np.multiply(deviations, deviations, out=deviations)
+        var = np.bincount(index, weights=deviations, minlength=n_bins) / count
+
+    minimum = np.full(n_bins, np.inf)
+    maximum = np.full(n_bins, -np.inf)
+    np.minimum.at(minimum, index, values)
+    np.maximum.at(maximum, index, values)
+    minimum[count == 0] = np.nan
+    maximum[count == 0] = np.nan
+    return {"count": count, "mean": mean, "var": var, "min": minimum, "max": maximum}
+
+
+def stim_stats(stim, mask_keys=None, img=None):
+    # region_stats of stim["img"] (or img, e.g. model outputs for stim) for
+    # each of its masks (default: every *_mask key)
+    if mask_keys is None:
+        mask_keys = [key for key in stim if key.endswith("_mask")]
+    img = stim["img"] if img is None else img
+    return {key: region_stats(img, stim[key]) for key in mask_keys}
@@ -0,0 +1,166 @@
+"""
+Render the demo headless: every frame of ecvp2024_demo.slideSequence to a file.
+
+No HRL or window is needed, so the slide sequence can be checked in CI. Frames
+are streamed from a generator into a writer one at a time, so memory stays
+bounded by one frame (y4m) or one chunk of frames (.npy). Frames are quantized
+to 8 bit and padded (with the background) to the largest slide shape.
+
+    python render_offline.py demo.y4m            # grayscale YUV4MPEG2 video
+    python render_offline.py frames/ --chunk 64  # frames/frames_00000.npy, ...
+    python render_offline.py - | ffplay -        # stream to stdout
+
+The overall rendering throughput (frames per second) is reported at the end.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from canvas import centered_offset
+
+
+# %% Frames
+def frames(sequence, prepare):
+    # Every frame of every slide's transition: (slide name, t, frame). The
+    # frame may be a reused buffer: use it before requesting the next one
+    for slide in sequence:
+        transition = prepare(slide)
+        for t in range(len(transition)):
+            yield slide.name, t, transition.frame(t)
+
+
+def frame_shape(sequence):
+    return tuple(np.max([img.shape for slide in sequence for img in slide.images], axis=0))
+
+
+class Quantizer:
+    # Quantizes (and pads) frames into one reused uint8 buffer
+    def __init__(self, shape, fill_value=0.0):
+        self.out = np.empty(shape, dtype=np.uint8)
+        self.fill = np.uint8(np.rint(np.clip(fill_value, 0.0, 1.0) * 255))
+        self._scratch = np.empty(shape, dtype=float)
+        self._shape = None
+
+    def __call__(self, frame):
+        if frame.shape != self._shape:
+            # Only a change of frame shape needs a new border
+            self.out.fill(self.fill)
+            self._shape = frame.shape
+        offset = centered_offset(self.out.shape, frame.shape)
+        region = tuple(slice(start, start + size) for start, size in zip(offset, frame.shape))
+
+        scratch = self._scratch[region]
+        np.clip(frame, 0.0, 1.0, out=scratch)
+        np.multiply(scratch, 255, out=scratch)
+        np.rint(scratch, out=scratch)
+        self.out[region] = scratch
+        return self.out
+
+
+# %% Writers
+class Y4MWriter:
+    # Grayscale (Cmono) YUV4MPEG2 stream; path "-" writes to stdout
+    def __init__(self, path, shape, rate=60):
+        self.file = sys.stdout.buffer if str(path) == "-" else open(path, "wb")
+        height, width = shape
+        self.file.write(f"YUV4MPEG2 W{width} H{height} F{rate}:1 Ip A1:1 Cmono\n".encode())
+        self.n_frames = 0
+
+    def write(self, frame):
+        self.file.write(b"FRAME\n")
+        self.file.write(np.ascontiguousarray(frame).data)
+        self.n_frames += 1
+
+    def close(self):
+        self.file.flush()
+        if self.file is not sys.stdout.buffer:
+            self.file.close()
+
+
+class NpyChunkWriter:
+    # Frames in chunks of (chunk, height, width) .npy files, plus index.json
+    # with the slide name and frame index of every frame
+    def __init__(self, directory, shape, rate=60, chunk=64):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.buffer = np.empty((chunk, *shape), dtype=np.uint8)
+        self.rate = rate
+        self.chunks = []
+        self.n_frames = 0
+        self._filled = 0
+
+    def write(self, frame):
+        self.buffer[self._filled] = frame
+        self._filled += 1
+        self.n_frames += 1
+        if self._filled == len(self.buffer):
+            self._flush()
+
+    def _flush(self):
+        if self._filled:
+            name = f"frames_{len(self.chunks):05d}.npy"
+            np.save(self.directory / name, self.buffer[: self._filled])
+            self.chunks.append(name)
+            self._filled = 0
+
+    def close(self, labels=()):
+        self._flush()
+        index = {"rate": self.rate, "chunks": self.chunks, "frames": list(labels)}
+        (self.directory / "index.json").write_text(json.dumps(index))
+
+
+def open_writer(path, shape, rate=60, chunk=64):
+    if str(path) == "-" or str(path).endswith(".y4m"):
+        return Y4MWriter(path, shape, rate=rate)
+    return NpyChunkWriter(path, shape, rate=rate, chunk=chunk)
+
+
+# %% Render
+def render(sequence, prepare, writer, fill_value=0.0):
+    # Stream all frames into writer; returns throughput statistics
+    quantize = Quantizer(frame_shape(sequence), fill_value=fill_value)
+    labels = []
+    start = time.perf_counter()
+    for name, t, frame in frames(sequence, prepare):
+        writer.write(quantize(frame))
+        labels.append((name, t))
+    seconds = time.perf_counter() - start
+
+    if isinstance(writer, NpyChunkWriter):
+        writer.close(labels)
+    else:
+        writer.close()
+    return {"frames": len(labels), "seconds": seconds, "fps": len(labels) / seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("output", help="a .y4m file, '-' (y4m to stdout), or a directory for .npy")
+    parser.add_argument("--chunk", type=int, default=64, help="frames per .npy file (default: 64)")
+    args = parser.parse_args(argv)
+
+    import ecvp2024_demo as demo
+
+    shape = frame_shape(demo.slideSequence)
+    writer = open_writer(args.output, shape, rate=demo.rate, chunk=args.chunk)
+    stats = render(
+        demo.slideSequence,
+        demo.prepareSlide,
+        writer,
+        fill_value=demo.meta["intensity_background"],
+    )
+    print(
+        f"Rendered {stats['frames']} frames ({shape[1]}x{shape[0]}) in {stats['seconds']:.2f} s: "
+        f"{stats['fps']:.1f} fps",
+        file=sys.stderr,
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Slides for ecvp2024_demo.py, prebuilt into one memory-mapped bundle file.
+
+Building the slides decodes the natural image and generates (and pads) all
+stimuli, which takes seconds. `python slides.py` writes every slide image into
+BUNDLE_PATH: a small header plus contiguous, aligned arrays. load() maps that
+file, and only rebuilds it when stimuli.py, canvas.py, pyramid.py, images.py,
+this file, the natural image or the stimupy version changed.
+
+Layout of the bundle:
+    MAGIC (8 bytes) | header length (uint64, little endian) | JSON header |
+    arrays, each starting at a multiple of ALIGN bytes
+
+The JSON header holds the fingerprint, meta data and, per slide, the
+offset, shape and dtype of its array.
+"""
+
+import hashlib
+import json
+import struct
+from importlib import metadata
+from pathlib import Path
+
+import numpy as np
+
+from atomic import atomic_write
+
+DIR = Path(__file__).parent
+BUNDLE_PATH = DIR / "slides.bundle"
+NATURAL_IMAGE = DIR / "natural_scene_kingdom2011.png"
+SHAPE = (768, 1024)
+
+MAGIC = b"SLIDES01"
+ALIGN = 64
+
+
+# %% Slides
+def build():
+    # Deferred: importing stimupy alone takes longer than loading a bundle
+    import stimupy
+
+    import stimuli
+    from canvas import pad
+    from images import natural_scene
+    from pyramid import Pyramid
+
+    background = stimuli.INTENSITY_BACKGROUND
+    intensity_contexts = {
+        "black": 0.0,
+        "background": background,
+        "white": 1.0,
+    }
+
+    def pad_slide(stim):
+        return pad(stim, shape=SHAPE, pad_value=background)["img"]
+
+    s = {}
+
+    ############ Natural image
+    s["s0"] = natural_scene["img"]
+
+    ############# Simplify
+    # sbc black
+    s["s1"] = pad_slide(
+        stimuli.sbc(
+            contexts=["black", "background"],
+            intensity_contexts=intensity_contexts,
+            intensity_targets=(0.5, background),
+        )
+    )
+
+    # sbc white
+    s["s2"] = pad_slide(
+        stimuli.sbc(
+            contexts=["background", "white"],
+            intensity_contexts=intensity_contexts,
+            intensity_targets=(background, 0.5),
+        )
+    )
+
+    # sbc full
+    s["s3"] = pad_slide(stimuli.sbc())
+
+    ############# Context effects
+    # sbc small
+    s["s4"] = pad_slide(stimuli.sbc_separate())
+    s["s5"] = pad_slide(stimuli.sbc_smallest())
+    s["s5_flipped"] = np.fliplr(s["s5"])
+
+    # bullseye
+    s["s6"] = pad_slide(stimuli.bullseye_separate())
+    s["s7"] = pad_slide(stimuli.bullseye_high_freq())
+
+    # checkerboard
+    s["s7_"] = pad_slide(stimuli.cross())
+    s["s8"] = pad_slide(stimuli.checkerboard_smallest())
+    s["s9"] = pad_slide(stimuli.checkerboard_separate())
+    s["s10"] = pad_slide(stimuli.checkerboard())
+
+    # White's
+    s["s11"] = pad_slide(stimuli.cross_polarity())
+    s["s12"] = pad_slide(stimuli.whites_separate())
+    s["s14"] = pad_slide(stimuli.whites())
+    s["s15"] = pad_slide(stimuli.whitesLong())
+    s["s16"] = pad_slide(stimuli.whiteHowe())
+
+    # s3, s7, s10 / s14, s15, s16, rendered tile by tile from their labels
+    s["sStack"] = stimuli.gen_mosaic(
+        [
+            ["sbc", "bullseye_high_freq", "checkerboard"],
+            ["whites", "whitesLong", "whiteHowe"],
+        ],
+        cell_shape=SHAPE,
+    )
+    # Area-averaged, not decimated, for the final overview
+    s["sStack_half"] = Pyramid(s["sStack"]).levels[1]
+
+    slides = {name: np.ascontiguousarray(img) for name, img in s.items()}
+    meta = {"intensity_background": background, "stimupy": stimupy.__version__}
+    return slides, meta
+
+
+# %% Bundle
+def fingerprint():
+    digest = hashlib.sha256()
+    sources = ("stimuli.py", "canvas.py", "pyramid.py", "images.py")
+    for path in (*(DIR / source for source in sources), Path(__file__), NATURAL_IMAGE):
+        digest.update(path.read_bytes())
+    digest.update(metadata.version("stimupy").encode())
+    return digest.hexdigest()
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+def write(slides, meta=None, path=BUNDLE_PATH, fingerprint=None):
+    index = {}
+    header = {"fingerprint": fingerprint, "meta": meta or {}, "slides": index}
+
+    # The header size depends on the offsets, so lay out the arrays after a
+    # generous upper bound of the header
+    data_start = _aligned(len(MAGIC) + 8 + len(json.dumps(header)) + 128 * (len(slides) + 1))
+    offset = data_start
+    for name, img in slides.items():
+        index[name] = {"offset": offset, "shape": img.shape, "dtype": img.dtype.str}
+        offset = _aligned(offset + img.nbytes)
+    header_bytes = json.dumps(header).encode()
+    assert len(MAGIC) + 8 + len(header_bytes) <= data_start
+
+    with atomic_write(path) as f:
+        f.write(MAGIC + struct.pack("<Q", len(header_bytes)) + header_bytes)
+        for name, img in slides.items():
+            f.seek(index[name]["offset"])
+            f.write(np.ascontiguousarray(img).tobytes())
+        f.truncate(max(offset, data_start))
+
+
+def read(path=BUNDLE_PATH):
+    # Returns (header, {name: read-only array mapped from the bundle})
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a slide bundle")
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    slides = {}
+    for name, entry in header["slides"].items():
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"]))
+        slides[name] = (
+            buffer[entry["offset"] : entry["offset"] + count * dtype.itemsize]
+            .view(dtype)
+            .reshape(entry["shape"])
+        )
+    return header, slides
+
+
+def load(path=BUNDLE_PATH, rebuild=True):
+    # Map the bundle, (re)building it first if it is missing or out of date
+    current = fingerprint()
+    try:
+        header, slides = read(path)
+        if header["fingerprint"] == current or not rebuild:
+            return header["meta"], slides
+    except (FileNotFoundError, ValueError):
+        if not rebuild:
+            raise
+
+    write(*build(), path=path, fingerprint=current)
+    header, slides = read(path)
+    return header["meta"], slides
+
+
+if __name__ == "__main__":
+    slides, meta = build()
+    write(slides, meta, fingerprint=fingerprint())
+    print(f"Wrote {len(slides)} slides to {BUNDLE_PATH}")
@@ -0,0 +1,177 @@
+"""
+Persistent, content-addressed disk cache for stimuli.py calls.
+
+Entries are keyed by function name, normalized arguments and the stimupy
+version. Each entry is a directory of uncompressed .npy files (one per array)
+plus a pickle of the remaining values; arrays are memory-mapped (read-only)
+on load. Entries are written to a temporary directory and renamed into
+place, so several processes can share one cache. Once the cache grows past
+max_size bytes, least-recently-used entries are removed, as are temporary
+directories left behind by crashed writers.
+
+    cache = DiskCache()
+    stim = cache(stimuli.cross, ppd=72)
+"""
+
+import hashlib
+import inspect
+import os
+import pickle
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import stimupy
+
+import stimuli
+from atomic import atomic_directory
+from calibration import Calibration
+
+DEFAULT_DIR = Path(
+    os.environ.get("STIMULI_CACHE_DIR", Path.home() / ".cache" / "ecvp2024_stimuli")
+)
+DEFAULT_MAX_SIZE = 2**30  # bytes
+STALE_AGE = 3600  # s, after which a temporary directory is left over from a crash
+
+
+def _canonical(value):
+    # stimuli._normalize, with numbers as float (ppd=36 and ppd=36.0 are one entry)
+    # and calibrations by their lookup table (their repr holds an address)
+    if isinstance(value, tuple):
+        return tuple(_canonical(val) for val in value)
+    if isinstance(value, Calibration):
+        lut = np.ascontiguousarray(value.lut)
+        digest = hashlib.sha256(f"{value.bit_depth}{lut.dtype.str}".encode())
+        digest.update(lut.data)
+        return ("Calibration", digest.hexdigest())
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+class DiskCache:
+    def __init__(self, directory=DEFAULT_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, func, *args, **kwargs):
+        if isinstance(func, str):
+            func = getattr(stimuli, func)
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        canonical = _canonical(stimuli._normalize(tuple(bound.arguments.items())))
+        return hashlib.sha256(
+            repr((func.__name__, canonical, stimupy.__version__)).encode()
+        ).hexdigest()
+
+    def __call__(self, func, *args, **kwargs):
+        if isinstance(func, str):
+            func = getattr(stimuli, func)
+        key = self.key(func, *args, **kwargs)
+
+        stim = self.load(key)
+        if stim is None:
+            stim = func(*args, **kwargs)
+            self.store(key, stim)
+            self.evict()
+            # Hand out the memory-mapped copy, unless it was evicted right away
+            stored = self.load(key)
+            if stored is not None:
+                stim = stored
+        return stim
+
+    def load(self, key):
+        path = self.directory / key
+        try:
+            with open(path / "values.pickle", "rb") as f:
+                stim = pickle.load(f)
+            for name in stim.pop("__arrays__"):
+                stim[name] = np.load(path / f"{name}.npy", mmap_mode="r")
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            # Not cached, or evicted while loading
+            return None
+
+        return stim.get("__array__", stim)
+
+    def store(self, key, stim):
+        path = self.directory / key
+        if path.exists():
+            return
+
+        # If another process stores the same entry first, its entry is kept
+        with atomic_directory(path) as tmp:
+            arrays = {"__array__": stim} if isinstance(stim, np.ndarray) else stim
+            values = {"__arrays__": []}
+            for name, value in arrays.items():
+                if isinstance(value, np.ndarray):
+                    np.save(tmp / f"{name}.npy", value, allow_pickle=False)
+                    values["__arrays__"].append(name)
+                else:
+                    values[name] = value
+            with open(tmp / "values.pickle", "wb") as f:
+                pickle.dump(values, f)
+
+    def entries(self):
+        # (last used, size in bytes, path) of every complete entry; anything
+        # else in the directory (e.g. other caches) is left alone
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.startswith(".") or not (path / "values.pickle").is_file():
+                continue
+            try:
+                size = sum(file.stat().st_size for file in path.iterdir())
+                entries.append((path.stat().st_mtime, size, path))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def remove_stale(self, max_age=STALE_AGE):
+        # Temporary and half-removed directories (.<key>.*) of crashed processes
+        now = time.time()
+        for path in self.directory.iterdir():
+            try:
+                if path.name.startswith(".") and now - path.stat().st_mtime > max_age:
+                    shutil.rmtree(path, ignore_errors=True)
+            except FileNotFoundError:
+                continue
+
+    def evict(self, max_size=None):
+        self.remove_stale()
+        max_size = self.max_size if max_size is None else max_size
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        self.remove_stale()
+        for _, _, path in self.entries():
+            self._remove(path)
+
+    def _remove(self, path):
+        # Rename first, so readers never see a partially removed entry
+        trash = path.with_name(f".{path.name}.removed.{os.getpid()}")
+        try:
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(trash, ignore_errors=True)
+
+
+_default_cache = None
+
+
+def cached(func, *args, **kwargs):
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = DiskCache()
+    return _default_cache(func, *args, **kwargs)
@@ -0,0 +1,222 @@
+"""
+Streaming stimulus-space runner: the lazy counterpart of
+stimupy.utils.permutate_params + create_stimspace_stimuli.
+
+Parameter combinations are enumerated lazily, and stimuli are generated and
+yielded one at a time, so a space of tens of thousands of points never has
+to fit in memory. Duplicates are generated only once:
+- parameter sets that are equal after canonicalization (defaults applied,
+  lists as tuples, 2 == 2.0) are skipped before generating;
+- stimuli whose pixels (img and all masks) equal an earlier stimulus, e.g.
+  when only unused parameters differ, are not yielded or stored again.
+
+With a directory, the results are written (and held in memory) in chunks of
+chunk_size points: chunk_00000.npz with the arrays, chunk_00000.pickle with
+the parameters and other values. A chunk is complete once its pickle exists;
+an interrupted run resumes after the last complete chunk, and stimuli from
+complete chunks are read back instead of being generated:
+
+    space = {"check_visual_size": [1, 2, 4], "ppd": [24], "board_shape": [(5, 10), (3, 5)]}
+    for index, params, stim in run(checkerboard, space, "checkerboards/"):
+        ...
+    index = load_index("checkerboards/")  # every point, with its duplicate_of
+"""
+
+import hashlib
+import inspect
+import itertools
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from atomic import atomic_write
+
+MANIFEST = "space.pickle"
+
+
+# %% Parameters
+def permutations(params):
+    # Lazy stimupy.utils.permutate_params
+    if not isinstance(params, dict):
+        raise ValueError("params needs to be a dict with all stimulus parameters")
+    keys = list(params)
+    for values in itertools.product(*params.values()):
+        yield dict(zip(keys, values))
+
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _canonical(val)) for key, val in value.items()))
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_canonical(val) for val in value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def params_key(func, params):
+    # Identical for parameter sets that call func identically
+    bound = inspect.signature(func).bind(**params)
+    bound.apply_defaults()
+    canonical = (func.__module__, func.__name__, _canonical(dict(bound.arguments)))
+    return hashlib.sha256(repr(canonical).encode()).hexdigest()
+
+
+def stim_digest(stim):
+    # Hash of the pixels: img and all masks (with their shapes and dtypes)
+    digest = hashlib.sha256()
+    for key in sorted(stim):
+        value = stim[key]
+        if isinstance(value, np.ndarray) and (key == "img" or key.endswith("_mask")):
+            value = np.ascontiguousarray(value)
+            digest.update(f"{key}{value.shape}{value.dtype.str}".encode())
+            digest.update(value.data)
+    return digest.hexdigest()
+
+
+# %% Generation
+class _Seen:
+    # First index of every params key and stimulus digest
+    def __init__(self):
+        self.params = {}
+        self.pixels = {}
+
+    def add(self, record):
+        first = record["index"] if record["duplicate_of"] is None else record["duplicate_of"]
+        self.params.setdefault(record["key"], first)
+        if record["digest"] is not None:
+            self.pixels.setdefault(record["digest"], record["index"])
+
+
+def _generate(func, points, seen):
+    # (record, stim) per point; stim is None for duplicates
+    for index, params in points:
+        record = {"index": index, "params": params, "key": params_key(func, params)}
+        record.update(digest=None, duplicate_of=seen.params.get(record["key"]))
+        stim = None
+        if record["duplicate_of"] is None:
+            stim = func(**params)
+            record["digest"] = stim_digest(stim)
+            record["duplicate_of"] = seen.pixels.get(record["digest"])
+            if record["duplicate_of"] is not None:
+                stim = None
+        seen.add(record)
+        yield record, stim
+
+
+def generate(func, params):
+    # Yields (index, params, stim) for every unique point, in memory only
+    for record, stim in _generate(func, enumerate(permutations(params)), _Seen()):
+        if stim is not None:
+            yield record["index"], record["params"], stim
+
+
+# %% Chunked output
+def _chunk_path(directory, chunk, suffix):
+    return Path(directory) / f"chunk_{chunk:05d}.{suffix}"
+
+
+def _write_chunk(directory, chunk, results):
+    arrays, records = {}, []
+    for record, stim in results:
+        record = dict(record, values=None, arrays=[])
+        if stim is not None:
+            record["values"] = {}
+            for key, value in stim.items():
+                if isinstance(value, np.ndarray):
+                    arrays[f"{record['index']}/{key}"] = value
+                    record["arrays"].append(key)
+                else:
+                    record["values"][key] = value
+        records.append(record)
+
+    # The pickle is written last: it marks the chunk as complete
+    with atomic_write(_chunk_path(directory, chunk, "npz")) as f:
+        np.savez(f, **arrays)
+    with atomic_write(_chunk_path(directory, chunk, "pickle")) as f:
+        pickle.dump(records, f)
+
+
+def _read_records(directory, chunk):
+    try:
+        with open(_chunk_path(directory, chunk, "pickle"), "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _read_chunk(directory, chunk, records):
+    with np.load(_chunk_path(directory, chunk, "npz")) as arrays:
+        for record in records:
+            if record["values"] is not None:
+                stim = dict(record["values"])
+                for key in record["arrays"]:
+                    stim[key] = arrays[f"{record['index']}/{key}"]
+                yield record["index"], record["params"], stim
+
+
+def _check_manifest(directory, func, params, chunk_size):
+    manifest = {
+        "function": f"{func.__module__}.{func.__name__}",
+        "params": {key: list(values) for key, values in params.items()},
+        "chunk_size": chunk_size,
+    }
+    path = Path(directory) / MANIFEST
+    if path.exists():
+        with open(path, "rb") as f:
+            if pickle.load(f) != manifest:
+                raise ValueError(f"{directory} holds the output of a different stimulus space")
+    else:
+        with atomic_write(path) as f:
+            pickle.dump(manifest, f)
+
+
+def run(func, params, directory, chunk_size=256):
+    # Yields (index, params, stim) for every unique point, like generate(),
+    # and writes chunked output to directory; resumes after complete chunks
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    _check_manifest(directory, func, params, chunk_size)
+
+    seen = _Seen()
+    points = enumerate(permutations(params))
+    for chunk in itertools.count():
+        batch = list(itertools.islice(points, chunk_size))
+        if not batch:
+            return
+
+        records = _read_records(directory, chunk)
+        if records is not None:
+            for record in records:
+                seen.add(record)
+            yield from _read_chunk(directory, chunk, records)
+            continue
+
+        results = list(_generate(func, batch, seen))
+        _write_chunk(directory, chunk, results)
+        for record, stim in results:
+            if stim is not None:
+                yield record["index"], record["params"], stim
+
+
+def load_index(directory):
+    # Records (index, params, key, digest, duplicate_of, ...) of every point
+    # in the complete chunks of directory
+    records = []
+    for chunk in itertools.count():
+        chunk_records = _read_records(directory, chunk)
+        if chunk_records is None:
+            return records
+        records.extend(chunk_records)
+
+
+def load(directory):
+    # Yields (index, params, stim) for every unique point in directory
+    for chunk in itertools.count():
+        records = _read_records(directory, chunk)
+        if records is None:
+            return
+        yield from _read_chunk(directory, chunk, records)
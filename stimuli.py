@@ -1,5 +1,14 @@
 # %%
+import functools
+import inspect
+import itertools
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from copy import deepcopy
+from multiprocessing import resource_tracker, shared_memory
 
 import numpy as np
 import stimupy
@@ -44,6 +53,330 @@ def VISUAL_SIZE(target_size, n_surrounds):
     return np.array((1, ASPECT_RATIO)) * (n_surrounds * 2 + 1) * target_size
 
 
+# %% OUTPUT DTYPE       #
+# -------------------------- #
+# Generators compute in float64; dtype/bit_depth only convert the output.
+# Integer dtypes quantize intensities [0, 1] to the levels 0 .. 2**bit_depth - 1
+# (bit_depth defaults to the full width of dtype, dtype to the smallest unsigned
+# int holding bit_depth): values are clipped to [0, 1] and rounded to the
+# nearest level, ties to even (np.rint).
+# A calibration (calibration.Calibration) instead maps intensities to monitor
+# DAC values; for rendered stimuli it is applied to the palette.
+# Masks are returned in the smallest integer dtype that holds their labels.
+def quantize(img, dtype=None, bit_depth=None):
+    if dtype is None:
+        dtype = np.uint16 if bit_depth is not None and bit_depth > 8 else np.uint8
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return img.astype(dtype, copy=False)
+    if dtype.kind != "u":
+        raise ValueError(f"Cannot quantize to {dtype}, use a float or unsigned int dtype")
+
+    if bit_depth is None:
+        bit_depth = dtype.itemsize * 8
+    if not 0 < bit_depth <= dtype.itemsize * 8:
+        raise ValueError(f"bit_depth {bit_depth} does not fit in {dtype}")
+
+    levels = 2**bit_depth - 1
+    return np.rint(np.clip(img, 0.0, 1.0) * levels).astype(dtype)
+
+
+def shrink_mask(mask):
+    # Smallest integer dtype that holds all labels in mask
+    if mask.size == 0:
+        return mask.astype(np.uint8)
+    dtype = np.result_type(np.min_scalar_type(mask.min()), np.min_scalar_type(mask.max()))
+    return mask.astype(dtype, copy=False)
+
+
+def convert_img(img, dtype=None, bit_depth=None, calibration=None):
+    # img (or a palette) quantized, or calibrated; unchanged by default
+    if calibration is not None:
+        if dtype is not None or bit_depth is not None:
+            raise ValueError("Pass either a calibration or dtype/bit_depth, not both")
+        return calibration(img)
+    if dtype is None and bit_depth is None:
+        return img
+    return quantize(img, dtype=dtype, bit_depth=bit_depth)
+
+
+def convert_stim(stim, dtype=None, bit_depth=None, calibration=None):
+    quantized = dtype is not None or bit_depth is not None
+    if not quantized and calibration is None:
+        return stim
+
+    if isinstance(stim, np.ndarray):
+        return shrink_mask(stim) if quantized else stim
+    stim = dict(stim)
+    for key, value in stim.items():
+        if key == "img":
+            stim[key] = convert_img(value, dtype, bit_depth, calibration)
+        elif quantized and key.endswith("_mask") and isinstance(value, np.ndarray):
+            stim[key] = shrink_mask(value)
+    return stim
+
+
+# %% CACHE              #
+# -------------------------- #
+# Composite stimuli (bullseye_separate, checkerboard_smallest, cross, ...) are
+# built from the same intermediate stimuli, so every generator is memoized on
+# its (normalized) arguments. Cached arrays are read-only and shared between
+# the generators; the outermost call returns writable copies (with the masks
+# shrunk), so callers can modify their stimuli in place without touching the
+# cache.
+CACHE_MAX_BYTES = 2**29  # max. total size of the cached arrays, least-recently-used evicted
+
+_cache = OrderedDict()  # key: (stim, nbytes)
+_cache_stats = {"hits": 0, "misses": 0, "bytes": 0}
+_cache_lock = threading.Lock()
+_building = {}  # key: Future of a stimulus being generated by another thread
+_calls = threading.local()  # depth of nested generator calls, per thread
+
+
+def _normalize(value):
+    if isinstance(value, dict):
+        return tuple((key, _normalize(val)) for key, val in value.items())
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_normalize(val) for val in value)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(val) for val in value.values())
+    return 0
+
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, dict):
+        for val in value.values():
+            _freeze(val)
+    return value
+
+
+def _thaw(value, copy=False, mask=False):
+    # Fresh containers around the shared, read-only arrays, or writable
+    # copies of them (masks in the smallest dtype holding their labels)
+    if isinstance(value, np.ndarray):
+        if not copy:
+            return value
+        if mask and value.dtype.kind in "ui":
+            shrunk = shrink_mask(value)
+            return shrunk if shrunk is not value else value.copy()
+        return value.copy()
+    if isinstance(value, dict):
+        return {
+            key: _thaw(val, copy, isinstance(key, str) and key.endswith("_mask"))
+            for key, val in value.items()
+        }
+    return deepcopy(value)
+
+
+def _store(key, stim):
+    nbytes = _nbytes(stim)
+    if nbytes > CACHE_MAX_BYTES:
+        return
+    _, old_nbytes = _cache.pop(key, (None, 0))
+    _cache[key] = (stim, nbytes)
+    _cache_stats["bytes"] += nbytes - old_nbytes
+    while _cache_stats["bytes"] > CACHE_MAX_BYTES:
+        _, (_, evicted) = _cache.popitem(last=False)
+        _cache_stats["bytes"] -= evicted
+
+
+def memoize(func):
+    # Also adds the keyword-only dtype, bit_depth and calibration output
+    # options (see above)
+    signature = inspect.signature(func)
+
+    def make_key(bound):
+        bound.apply_defaults()
+        return (func.__name__, _normalize(tuple(bound.arguments.items())))
+
+    def cached(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        key = make_key(bound)
+
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry is not None:
+                _cache.move_to_end(key)
+                _cache_stats["hits"] += 1
+                return entry[0]
+            building = _building.get(key)
+            if building is None:
+                _cache_stats["misses"] += 1
+                future = _building[key] = Future()
+            else:
+                _cache_stats["hits"] += 1
+
+        # Another thread is generating this stimulus: wait for it
+        if building is not None:
+            return building.result()
+
+        # Generate outside the lock, so threads can build different stimuli
+        try:
+            stim = _freeze(func(*bound.args, **bound.kwargs))
+        except BaseException as error:
+            with _cache_lock:
+                del _building[key]
+            future.set_exception(error)
+            raise
+        with _cache_lock:
+            _store(key, stim)
+            del _building[key]
+        scope = getattr(_calls, "scope", None)
+        if scope is not None:
+            scope.append(key)
+        future.set_result(stim)
+
+        return stim
+
+    @functools.wraps(func)
+    def wrapper(*args, dtype=None, bit_depth=None, calibration=None, **kwargs):
+        depth = getattr(_calls, "depth", 0)
+        _calls.depth = depth + 1
+        try:
+            stim = cached(*args, **kwargs)
+        finally:
+            _calls.depth = depth
+        stim = _thaw(stim, copy=depth == 0, mask=True)
+        if dtype is None and bit_depth is None and calibration is None:
+            return stim
+        return convert_stim(stim, dtype=dtype, bit_depth=bit_depth, calibration=calibration)
+
+    def cache_discard(*args, dtype=None, bit_depth=None, calibration=None, **kwargs):
+        # Drop the cached stimulus for these arguments (not its intermediates)
+        key = make_key(signature.bind(*args, **kwargs))
+        with _cache_lock:
+            _, nbytes = _cache.pop(key, (None, 0))
+            _cache_stats["bytes"] -= nbytes
+
+    wrapper.cache_discard = cache_discard
+    wrapper.__signature__ = signature.replace(
+        parameters=[
+            *signature.parameters.values(),
+            inspect.Parameter("dtype", inspect.Parameter.KEYWORD_ONLY, default=None),
+            inspect.Parameter("bit_depth", inspect.Parameter.KEYWORD_ONLY, default=None),
+            inspect.Parameter("calibration", inspect.Parameter.KEYWORD_ONLY, default=None),
+        ]
+    )
+    return wrapper
+
+
+def cache_clear():
+    with _cache_lock:
+        _cache.clear()
+        _cache_stats.update(hits=0, misses=0, bytes=0)
+
+
+def cache_info():
+    with _cache_lock:
+        return {**_cache_stats, "size": len(_cache), "maxbytes": CACHE_MAX_BYTES}
+
+
+@contextmanager
+def transient_cache():
+    # Stimuli generated (by this thread) inside the block are dropped from
+    # the cache when it ends; ones cached before are kept
+    outer = getattr(_calls, "scope", None)
+    _calls.scope = []
+    try:
+        yield
+    finally:
+        keys, _calls.scope = _calls.scope, outer
+        with _cache_lock:
+            for key in keys:
+                _, nbytes = _cache.pop(key, (None, 0))
+                _cache_stats["bytes"] -= nbytes
+
+
+# %% EXECUTORS          #
+# -------------------------- #
+# Generators can run on any concurrent.futures executor. Threads share the
+# cache above; process pool workers return their arrays through shared memory
+# blocks instead of pickling them back.
+def _to_shared(value, blocks):
+    if isinstance(value, np.ndarray):
+        block = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+        blocks.append(block)
+        np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)[...] = value
+        return ("shared_memory", block.name, value.shape, value.dtype.str)
+    if isinstance(value, dict):
+        return {key: _to_shared(val, blocks) for key, val in value.items()}
+    return value
+
+
+def _from_shared(value, read=True):
+    # Copies the arrays out of their blocks (read), and unlinks the blocks
+    if isinstance(value, tuple) and len(value) == 4 and value[0] == "shared_memory":
+        _, name, shape, dtype = value
+        try:
+            block = shared_memory.SharedMemory(name=name)
+        except FileNotFoundError:
+            if read:
+                raise
+            return None
+        try:
+            return np.ndarray(shape, dtype=dtype, buffer=block.buf).copy() if read else None
+        finally:
+            block.close()
+            block.unlink()
+    if isinstance(value, dict):
+        return {key: _from_shared(val, read) for key, val in value.items()}
+    return value
+
+
+def _shared_call(name, kwargs):
+    blocks = []
+    try:
+        shared = _to_shared(globals()[name](**kwargs), blocks)
+    except BaseException:
+        for block in blocks:
+            block.close()
+            block.unlink()
+        raise
+
+    # The parent process unlinks the blocks once it has read them
+    for block in blocks:
+        block.close()
+        resource_tracker.unregister(block._name, "shared_memory")
+    return shared
+
+
+def _run(calls, executor=None):
+    # calls: sequence of (function name, kwargs); results keep that order
+    if executor is None:
+        return [globals()[name](**kwargs) for name, kwargs in calls]
+
+    if isinstance(executor, ProcessPoolExecutor):
+        futures = [executor.submit(_shared_call, name, kwargs) for name, kwargs in calls]
+        results = []
+        try:
+            for future in futures:
+                results.append(_from_shared(future.result()))
+        finally:
+            # After an error (or interrupt), still unlink the blocks of the
+            # results that were not read
+            for future in futures[len(results) :]:
+                if future.cancel():
+                    continue
+                try:
+                    _from_shared(future.result(), read=False)
+                except BaseException:
+                    pass
+        return results
+
+    futures = [executor.submit(globals()[name], **kwargs) for name, kwargs in calls]
+    return [future.result() for future in futures]
+
+
 # def radii(target_size, n_surrounds):
 #     return (np.arange(n_surrounds * 2 + 1) + 1) * (target_size / 2)
 
@@ -51,21 +384,31 @@ def radii(target_size, n_surrounds):
     return (np.arange(n_surrounds + 1) + 1) * target_size - target_size/2
 
 
+def relabel_mask(mask, mapping, default=0):
+    # Map every label in mask through {label: value} in a single lookup;
+    # labels not in mapping get default
+    values = np.array([default, *mapping.values()])
+    lut = np.full(max([int(mask.max()), *mapping]) + 1, values[0])
+    lut[list(mapping)] = values[1:]
+    return lut[mask]
+
+
+@memoize
 def separation_mask(ppd=PPD, target_size=TARGET_SIZE, n_surrounds=N_SURROUNDS):
     stim = bullseye_high_freq(ppd=ppd, target_size=target_size)
 
     # Mask frames that need to be kept
     N_frames = len(radii(target_size, n_surrounds=n_surrounds))
-    separate_mask = np.zeros_like(stim["frame_mask"])
-    for frame in range(N_frames // 2):
-        separate_mask = np.where(stim["frame_mask"] == frame + 1, 1, separate_mask)
-        separate_mask = np.where(stim["frame_mask"] == N_frames + frame + 1, 1, separate_mask)
+    keep_frames = [
+        idx for frame in range(N_frames // 2) for idx in (frame + 1, N_frames + frame + 1)
+    ]
 
-    return separate_mask
+    return relabel_mask(stim["frame_mask"], dict.fromkeys(keep_frames, 1))
 
 
 # %% BULLSEYEs          #
 # -------------------------- #
+@memoize
 def bullseye(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -103,6 +446,7 @@ def bullseye(
     return stim
 
 
+@memoize
 def bullseye_high_freq(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -140,6 +484,7 @@ def bullseye_high_freq(
     return stim
 
 
+@memoize
 def bullseye_separate(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -167,6 +512,7 @@ def bullseye_separate(
 
 # %% SBCs            #
 # -------------------------- #
+@memoize
 def sbc(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -187,6 +533,7 @@ def sbc(
     )
 
 
+@memoize
 def sbc_separate(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -207,6 +554,7 @@ def sbc_separate(
     )
 
 
+@memoize
 def sbc_smallest(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -238,6 +586,7 @@ def checkerboard_target_cols(n_surrounds=N_SURROUNDS):
     }
 
 
+@memoize
 def checkerboard(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -263,6 +612,7 @@ def checkerboard(
     )
 
 
+@memoize
 def checkerboard_narrow(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -298,6 +648,7 @@ def checkerboard_narrow(
     )
 
 
+@memoize
 def checkerboard_separate(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -357,6 +708,7 @@ def checkerboard_separate(
     return stim
 
 
+@memoize
 def checkerboard_smallest(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -387,10 +739,7 @@ def checkerboard_smallest(
         n_surrounds=n_surrounds,
         intensity_background=intensity_background,
     )
-    inner_ring_mask = np.where(x["frame_mask"] < 3, 1, 0)
-    inner_ring_mask = np.where(
-        np.logical_and(x["frame_mask"] > 7, x["frame_mask"] < 9), 2, inner_ring_mask
-    )
+    inner_ring_mask = relabel_mask(x["frame_mask"], {0: 1, 1: 1, 2: 1, 8: 2})
     inner_ring_mask = np.where(stim["target_mask"], 0, inner_ring_mask)
 
     # Replace
@@ -402,6 +751,7 @@ def checkerboard_smallest(
     return stim
 
 
+@memoize
 def cross(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -423,12 +773,10 @@ def cross(
 
     # Corners mask
     corner_idcs_l = [7, 9, 17, 19]
-    corners_mask = np.zeros_like(stim["checker_mask"])
-    for idx in corner_idcs_l:
-        corners_mask = np.where(stim["checker_mask"] == idx, 1, corners_mask)
     corner_idcs_r = [32, 34, 42, 44]
-    for idx in corner_idcs_r:
-        corners_mask = np.where(stim["checker_mask"] == idx, 2, corners_mask)
+    corners_mask = relabel_mask(
+        stim["checker_mask"], {**dict.fromkeys(corner_idcs_l, 1), **dict.fromkeys(corner_idcs_r, 2)}
+    )
 
     # Remove
     stim["img"] = np.where(corners_mask, intensity_background, stim["img"])
@@ -436,6 +784,7 @@ def cross(
     return stim
 
 
+@memoize
 def cross_polarity(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -456,20 +805,20 @@ def cross_polarity(
     )
 
     # Flankers mask
-    flankers_h_mask = np.zeros_like(stim["checker_mask"])
     flankers_h_l_idcs = [12, 14]
-    for idx in flankers_h_l_idcs:
-        flankers_h_mask = np.where(stim["checker_mask"] == idx, 1, flankers_h_mask)
     flankers_h_r_idcs = [37, 39]
-    for idx in flankers_h_r_idcs:
-        flankers_h_mask = np.where(stim["checker_mask"] == idx, 2, flankers_h_mask)
+    flankers_h_mask = relabel_mask(
+        stim["checker_mask"],
+        {**dict.fromkeys(flankers_h_l_idcs, 1), **dict.fromkeys(flankers_h_r_idcs, 2)},
+    )
 
     # Switch polarity
     switched_contexts = (contexts[1], contexts[0])
-    for idx, context in enumerate(switched_contexts):
-        stim["img"] = np.where(
-            flankers_h_mask == idx + 1, intensity_contexts[context], stim["img"]
-        )
+    flankers_h_img = relabel_mask(
+        flankers_h_mask,
+        {idx + 1: intensity_contexts[context] for idx, context in enumerate(switched_contexts)},
+    )
+    stim["img"] = np.where(flankers_h_mask, flankers_h_img, stim["img"])
 
     return stim
 
@@ -483,6 +832,7 @@ def whites_target_indices(N_surrounds=N_SURROUNDS):
     }
 
 
+@memoize
 def whites(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -513,6 +863,7 @@ def whites(
     )
 
 
+@memoize
 def whitesLong(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -542,6 +893,7 @@ def whitesLong(
         intensity_target=intensity_targets,
     )
 
+@memoize
 def whiteHowe(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -579,6 +931,7 @@ def whiteHowe(
     return stim2
 
 
+@memoize
 def whites_narrow(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -615,6 +968,7 @@ def whites_narrow(
     )
 
 
+@memoize
 def whites_separate(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -681,6 +1035,7 @@ def whites_separate(
 
 # %% STRIP            #
 # -------------------------- #
+@memoize
 def strip(
     ppd=PPD,
     intensity_targets=(0.5, 0.5),
@@ -717,6 +1072,200 @@ def strip(
     )
 
 
+# %% LABELS & PALETTE   #
+# -------------------------- #
+# Geometry does not depend on intensities: rendering a stimulus with integer
+# codes as intensities gives a label image, and any set of intensities can then
+# be applied as a palette (lookup table) without rasterizing again.
+#   label 0:       background
+#   label 1..K:    contexts, in order of intensity_contexts
+#   label K+1,K+2: left, right target
+@memoize
+def geometry(
+    func,
+    ppd=PPD,
+    contexts=("black", "white"),
+    intensity_contexts=INTENSITY_CONTEXT,
+    target_size=TARGET_SIZE,
+    n_surrounds=N_SURROUNDS,
+):
+    if isinstance(func, str):
+        func = globals()[func]
+
+    codes = {context: idx + 1 for idx, context in enumerate(intensity_contexts)}
+    stim = func(
+        ppd=ppd,
+        intensity_targets=(len(codes) + 1, len(codes) + 2),
+        contexts=contexts,
+        intensity_contexts=codes,
+        target_size=target_size,
+        n_surrounds=n_surrounds,
+        intensity_background=0,
+    )
+
+    img = stim.pop("img")
+    labels = img.astype(np.uint8)
+    if not np.array_equal(labels, img):
+        raise ValueError(f"{func.__name__} does not render to a label image")
+    stim["labels"] = labels
+
+    # Not every generator maps codes as it maps intensities (e.g. gratings
+    # with a context at the background intensity): check against a real
+    # render, with distinct probe intensities for the targets and background
+    used = list(intensity_contexts.values())
+    probes = [value for value in np.linspace(0.05, 0.95, 19) if not np.isclose(value, used).any()]
+    real = func(
+        ppd=ppd,
+        intensity_targets=tuple(probes[1:3]),
+        contexts=contexts,
+        intensity_contexts=intensity_contexts,
+        target_size=target_size,
+        n_surrounds=n_surrounds,
+        intensity_background=probes[0],
+    )["img"]
+    rendered = render(labels, palette(tuple(probes[1:3]), intensity_contexts, probes[0]))
+    if not np.allclose(rendered, real):
+        raise ValueError(
+            f"The labels of {func.__name__} do not render to the stimulus for "
+            f"contexts={contexts}, intensity_contexts={intensity_contexts}"
+        )
+
+    return stim
+
+
+def palette(
+    intensity_targets=(0.5, 0.5),
+    intensity_contexts=INTENSITY_CONTEXT,
+    intensity_background=INTENSITY_BACKGROUND,
+):
+    return np.array(
+        (intensity_background, *intensity_contexts.values(), *intensity_targets), dtype=float
+    )
+
+
+def render(labels, palette, out=None):
+    return np.take(palette, labels, out=out)
+
+
+# %% TILED RENDERING    #
+# -------------------------- #
+# Mosaics (e.g. the slides' sStack) rendered tile by tile into a preallocated
+# output, in memory or an np.memmap (.npy) file. Only the label image (uint8)
+# of every cell is held; the cells are rasterized one at a time, and what that
+# cached is dropped right after (transient_cache). Peak memory is the label
+# images plus the rasterization of the largest cell, not the float mosaic:
+# each output tile is filled from the labels of the cells it overlaps.
+TILE_SHAPE = (512, 512)
+
+
+def output_array(shape, dtype=float, filename=None, fill_value=None):
+    if filename is None:
+        out = np.empty(shape, dtype=dtype)
+    else:
+        out = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=tuple(shape))
+    if fill_value is not None:
+        out[...] = fill_value
+    return out
+
+
+def mosaic_labels(grid, **kwargs):
+    # Label image of every cell of grid (rows of generators; None: empty)
+    labels = []
+    for row in grid:
+        labels.append([])
+        for func in row:
+            if func is None:
+                labels[-1].append(None)
+                continue
+            with transient_cache():
+                labels[-1].append(geometry(func, **kwargs)["labels"])
+    return labels
+
+
+def render_mosaic(labels, palette, cell_shape, out=None, tile_shape=TILE_SHAPE):
+    # Render the label images (rows of cells, each centered in cell_shape)
+    # through palette into out, tile by tile; palette[0] fills the rest
+    palette = np.asarray(palette)
+    shape = (len(labels) * cell_shape[0], max(map(len, labels)) * cell_shape[1])
+    if out is None:
+        out = np.empty(shape, dtype=palette.dtype)
+    if out.shape != shape:
+        raise ValueError(f"out has shape {out.shape}, the mosaic {shape}")
+
+    cells = []  # (top, left, labels)
+    for i, row in enumerate(labels):
+        for j, cell in enumerate(row):
+            if cell is None:
+                continue
+            if cell.shape[0] > cell_shape[0] or cell.shape[1] > cell_shape[1]:
+                raise ValueError(f"cell of shape {cell.shape} does not fit in {cell_shape}")
+            top, left = (region.start for region in _center_slices(cell_shape, cell.shape))
+            cells.append((i * cell_shape[0] + top, j * cell_shape[1] + left, cell))
+
+    tile_rows, tile_cols = tile_shape
+    for row in range(0, shape[0], tile_rows):
+        for col in range(0, shape[1], tile_cols):
+            tile = out[row : row + tile_rows, col : col + tile_cols]
+            tile[...] = palette[0]
+            for top, left, cell in cells:
+                rows = slice(max(row, top), min(row + tile.shape[0], top + cell.shape[0]))
+                cols = slice(max(col, left), min(col + tile.shape[1], left + cell.shape[1]))
+                if rows.start >= rows.stop or cols.start >= cols.stop:
+                    continue
+                np.take(
+                    palette,
+                    cell[rows.start - top : rows.stop - top, cols.start - left : cols.stop - left],
+                    out=tile[rows.start - row : rows.stop - row, cols.start - col : cols.stop - col],
+                )
+
+    return out
+
+
+def gen_mosaic(
+    grid,
+    cell_shape=None,
+    out=None,
+    filename=None,
+    tile_shape=TILE_SHAPE,
+    ppd=PPD,
+    intensity_targets=(0.5, 0.5),
+    contexts=("black", "white"),
+    intensity_contexts=INTENSITY_CONTEXT,
+    target_size=TARGET_SIZE,
+    n_surrounds=N_SURROUNDS,
+    intensity_background=INTENSITY_BACKGROUND,
+    dtype=None,
+    bit_depth=None,
+    calibration=None,
+):
+    # Mosaic of the generators in grid (rows; None: empty cell), each
+    # centered in a cell of cell_shape (default: the largest stimulus), on
+    # intensity_background. Rendered into out, or a new array/memmap
+    labels = mosaic_labels(
+        grid,
+        ppd=ppd,
+        contexts=contexts,
+        intensity_contexts=intensity_contexts,
+        target_size=target_size,
+        n_surrounds=n_surrounds,
+    )
+    lut = palette(
+        intensity_targets=intensity_targets,
+        intensity_contexts=intensity_contexts,
+        intensity_background=intensity_background,
+    )
+    lut = convert_img(lut, dtype=dtype, bit_depth=bit_depth, calibration=calibration)
+
+    if cell_shape is None:
+        shapes = [cell.shape for row in labels for cell in row if cell is not None]
+        cell_shape = tuple(np.max(shapes, axis=0))
+    if out is None:
+        shape = (len(labels) * cell_shape[0], max(map(len, labels)) * cell_shape[1])
+        out = output_array(shape, dtype=lut.dtype, filename=filename)
+
+    return render_mosaic(labels, lut, cell_shape, out=out, tile_shape=tile_shape)
+
+
 def gen_all(
     ppd=PPD,
     contexts=("black", "white"),
@@ -725,22 +1274,209 @@ def gen_all(
     target_size=TARGET_SIZE,
     n_surrounds=N_SURROUNDS,
     intensity_background=INTENSITY_BACKGROUND,
+    executor=None,
+    dtype=None,
+    bit_depth=None,
+    calibration=None,
 ):
-    # Initialize empty dict to hold all stims
-    stims = {}
-
-    for stim_name in __all__:
-        stims[stim_name] = globals()[stim_name](
-            ppd=ppd,
-            contexts=contexts,
-            intensity_contexts=intensity_contexts,
-            target_size=target_size,
-            n_surrounds=n_surrounds,
-            intensity_targets=intensity_targets,
-            intensity_background=intensity_background,
-        )
+    kwargs = dict(
+        ppd=ppd,
+        contexts=contexts,
+        intensity_contexts=intensity_contexts,
+        target_size=target_size,
+        n_surrounds=n_surrounds,
+        intensity_targets=intensity_targets,
+        intensity_background=intensity_background,
+        dtype=dtype,
+        bit_depth=bit_depth,
+        calibration=calibration,
+    )
+
+    stims = _run([(stim_name, kwargs) for stim_name in __all__], executor=executor)
+
+    return dict(zip(__all__, stims))
+
+
+# %% REGISTRY           #
+# -------------------------- #
+class StimulusRegistry(Mapping):
+    # Read-only mapping of stimulus name -> stimulus, generated on first access
+
+    def __init__(self, names=None, **kwargs):
+        self.names = tuple(__all__ if names is None else names)
+        self.kwargs = kwargs
+        self._stims = {}
+
+    def __getitem__(self, name):
+        if name not in self.names:
+            raise KeyError(name)
+        if name not in self._stims:
+            self._stims[name] = globals()[name](**self.kwargs)
+        return self._stims[name]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(generated={[*self._stims]}, names={[*self.names]})"
+
+    def prefetch(self, names=None, executor=None):
+        names = self.names if names is None else names
+        for name in names:
+            if name not in self.names:
+                raise KeyError(name)
+
+        names = [name for name in names if name not in self._stims]
+        stims = _run([(name, self.kwargs) for name in names], executor=executor)
+        self._stims.update(zip(names, stims))
+
+    def evict(self, name=None):
+        # Drop one (or, without name, every) generated stimulus, also from
+        # the memo cache, so that its arrays are freed
+        names = [*self._stims] if name is None else [name]
+        for name in names:
+            if self._stims.pop(name, None) is not None:
+                globals()[name].cache_discard(**self.kwargs)
+
+    def is_generated(self, name):
+        return name in self._stims
+
+
+def registry(
+    ppd=PPD,
+    contexts=("black", "white"),
+    intensity_contexts=INTENSITY_CONTEXT,
+    intensity_targets=(0.5, 0.5),
+    target_size=TARGET_SIZE,
+    n_surrounds=N_SURROUNDS,
+    intensity_background=INTENSITY_BACKGROUND,
+    names=None,
+    dtype=None,
+    bit_depth=None,
+    calibration=None,
+):
+    return StimulusRegistry(
+        names=names,
+        ppd=ppd,
+        contexts=contexts,
+        intensity_contexts=intensity_contexts,
+        target_size=target_size,
+        n_surrounds=n_surrounds,
+        intensity_targets=intensity_targets,
+        intensity_background=intensity_background,
+        dtype=dtype,
+        bit_depth=bit_depth,
+        calibration=calibration,
+    )
+
+
+# %% GRID               #
+# -------------------------- #
+GRID_PARAMS_DTYPE = [
+    ("ppd", float),
+    ("target_size", float),
+    ("n_surrounds", int),
+    ("context_left", "U16"),
+    ("context_right", "U16"),
+    ("intensity_target_left", float),
+    ("intensity_target_right", float),
+]
+
+
+def _center_slices(shape, inner_shape):
+    return tuple(
+        slice((size - inner) // 2, (size - inner) // 2 + inner)
+        for size, inner in zip(shape, inner_shape)
+    )
+
+
+def gen_grid(
+    func,
+    ppd=(PPD,),
+    contexts=(("black", "white"),),
+    intensity_targets=((0.5, 0.5),),
+    target_size=(TARGET_SIZE,),
+    n_surrounds=(N_SURROUNDS,),
+    intensity_contexts=INTENSITY_CONTEXT,
+    intensity_background=INTENSITY_BACKGROUND,
+    executor=None,
+    dtype=None,
+    bit_depth=None,
+    calibration=None,
+):
+    # Every geometry (ppd, target_size, n_surrounds, contexts) is rasterized
+    # once; all intensity_targets are rendered from it in one gather.
+    # Stimuli smaller than the largest one are centered and padded with
+    # intensity_background (masks with 0).
+    if not isinstance(func, str):
+        func = func.__name__
+
+    geometries = list(itertools.product(ppd, target_size, n_surrounds, contexts))
+    stims = _run(
+        [
+            (
+                "geometry",
+                dict(
+                    func=func,
+                    ppd=geom_ppd,
+                    contexts=geom_contexts,
+                    intensity_contexts=intensity_contexts,
+                    target_size=geom_target_size,
+                    n_surrounds=geom_n_surrounds,
+                ),
+            )
+            for geom_ppd, geom_target_size, geom_n_surrounds, geom_contexts in geometries
+        ],
+        executor=executor,
+    )
+
+    shape = tuple(np.max([stim["labels"].shape for stim in stims], axis=0))
+    mask_keys = sorted({key for stim in stims for key in stim if key.endswith("_mask")})
+    palettes = np.stack(
+        [
+            palette(
+                intensity_targets=targets,
+                intensity_contexts=intensity_contexts,
+                intensity_background=intensity_background,
+            )
+            for targets in intensity_targets
+        ]
+    )
+    # Quantize (or calibrate) the palettes, not the rendered images
+    palettes = convert_img(palettes, dtype, bit_depth, calibration)
+    background = convert_img(np.array(intensity_background), dtype, bit_depth, calibration)
+    # Masks in the smallest dtype holding their labels, as for single stimuli
+    mask_dtypes = {}
+    for key in mask_keys:
+        max_labels = [0, *(stim[key].max() for stim in stims if key in stim)]
+        mask_dtypes[key] = shrink_mask(np.array(max_labels)).dtype
+
+    N = len(geometries) * len(intensity_targets)
+    batch = {"img": np.full((N, *shape), background, dtype=palettes.dtype)}
+    for key in mask_keys:
+        batch[key] = np.zeros((N, *shape), dtype=mask_dtypes[key])
+
+    for idx, stim in enumerate(stims):
+        rows = slice(idx * len(intensity_targets), (idx + 1) * len(intensity_targets))
+        region = (rows, *_center_slices(shape, stim["labels"].shape))
+        batch["img"][region] = palettes[:, stim["labels"]]
+        for key in mask_keys:
+            if key in stim:
+                batch[key][region] = stim[key]
+
+    batch["params"] = np.array(
+        [
+            (geom_ppd, geom_target_size, geom_n_surrounds, *geom_contexts, *targets)
+            for geom_ppd, geom_target_size, geom_n_surrounds, geom_contexts in geometries
+            for targets in intensity_targets
+        ],
+        dtype=GRID_PARAMS_DTYPE,
+    )
 
-    return stims
+    return batch
 
 
 if __name__ == "__main__":
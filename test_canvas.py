@@ -0,0 +1,34 @@
+import numpy as np
+
+import stimuli
+from canvas import compose_layers
+
+
+def test_compose_layers_uint8_masks():
+    # Generators return uint8 masks; relabelling must not fail or wrap
+    sbc = stimuli.sbc(ppd=24)
+    whites = stimuli.whites(ppd=24)
+    assert whites["target_mask"].dtype == np.uint8
+
+    composed = compose_layers([(sbc, None), (whites, whites["target_mask"] > 0)])
+    target_mask = composed["target_mask"]
+    shown = whites["target_mask"] > 0
+    assert np.array_equal(
+        target_mask[shown], whites["target_mask"][shown] + sbc["target_mask"].max()
+    )
+    assert np.array_equal(target_mask[~shown], sbc["target_mask"][~shown])
+
+
+def test_compose_layers_labels_past_uint8():
+    bottom = np.full((4, 4), 200, dtype=np.uint8)
+    top = np.full((4, 4), 100, dtype=np.uint8)
+    top[0] = 0
+    composed = compose_layers(
+        [
+            ({"img": np.zeros((4, 4)), "region_mask": bottom}, None),
+            ({"img": np.ones((4, 4)), "region_mask": top}, top > 0),
+        ]
+    )
+    assert composed["region_mask"].dtype == np.uint16
+    assert (composed["region_mask"][0] == 200).all()
+    assert (composed["region_mask"][1:] == 300).all()
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from presenter import Presenter, ScriptedInput, Slide
+from textures import HeadlessGraphics, TexturePool
+from transitions import Crossfade
+
+NFRAMES = 10
+
+
+class FakeClock:
+    # Time only advances by sleeping (and by presenting frames)
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def run(events):
+    clock = FakeClock()
+    graphics = HeadlessGraphics()
+    textures = TexturePool(graphics)
+    live = []
+
+    def present(frame):
+        textures.acquire(frame).draw()
+        graphics.flip()
+        live.append(graphics.live_textures)
+        clock.sleep(1.0)  # one frame
+
+    images = [np.full((4, 6), value) for value in (0.0, 0.5, 1.0)]
+    slides = [Slide(f"s{idx}", images[idx - 1], img) for idx, img in enumerate(images)]
+    presenter = Presenter(
+        slides,
+        prepare=lambda slide: Crossfade(*slide.images, NFRAMES),
+        present=present,
+        inputs=ScriptedInput(events, clock=clock, sleep=clock.sleep),
+        clock=clock,
+    )
+    latencies = presenter.run()
+    return presenter, latencies, live
+
+
+def played(log):
+    # Slide indices in the order their frames were presented
+    return [idx for n, (idx, _) in enumerate(log) if n == 0 or log[n - 1][0] != idx]
+
+
+def test_plays_first_slide_then_quits():
+    presenter, latencies, _ = run([(20, "Space")])
+    assert presenter.log == [(0, t) for t in range(NFRAMES)]
+    assert latencies == []
+
+
+def test_right_during_fade_skips_to_next_slide():
+    # Idle from 10; Right at 20 starts slide 1, Right at 23 skips its fade
+    presenter, latencies, _ = run([(20, "Right"), (23, "Right"), (40, "Space")])
+    start = presenter.log.index((1, 0))
+    assert presenter.log[start : start + 4] == [(1, 0), (1, 1), (1, 2), (2, 0)]
+    assert presenter.log[-1] == (2, NFRAMES - 1)
+    assert [key for key, _ in latencies] == ["Right", "Right"]
+    assert [latency for _, latency in latencies] == pytest.approx([1.0, 1.0])
+
+
+def test_left_during_fade_reverses_to_previous_slide():
+    # Slide 1 starts at 20; at 23 it has shown t = 0, 1, 2
+    presenter, latencies, _ = run([(20, "Right"), (23, "Left"), (40, "Space")])
+    start = presenter.log.index((1, 0))
+    assert presenter.log[start:] == [(1, 0), (1, 1), (1, 2), (1, 1), (1, 0)]
+    assert presenter.idx == 0
+    assert [latency for _, latency in latencies] == pytest.approx([1.0, 1.0])
+
+
+def test_index_wraps_around():
+    # Left while idle on slide 0 replays the last slide
+    presenter, latencies, _ = run([(20, "Left"), (40, "Right"), (60, "Space")])
+    assert played(presenter.log) == [0, 2, 0]
+    assert presenter.idx == 0
+    assert [key for key, _ in latencies] == ["Left", "Right"]
+    assert [latency for _, latency in latencies] == pytest.approx([1.0, 1.0])
+
+
+def test_latency_includes_wait_for_poll():
+    # Pressed at 5.5 during the first fade: polled after the frame ending at
+    # 6, its first frame ends at 7
+    presenter, latencies, _ = run([(5.5, "Right"), (40, "Space")])
+    assert latencies[0][1] == pytest.approx(1.5)
+
+
+def test_live_textures_bounded():
+    events = [(20 + 2 * n, key) for n, key in enumerate(["Right", "Left"] * 10)]
+    _, _, live = run([*events, (80, "Space")])
+    assert max(live) <= 2
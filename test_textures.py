@@ -0,0 +1,55 @@
+import numpy as np
+
+from textures import HeadlessGraphics, TexturePool
+
+
+class FixedTexture:
+    # Like an hrl texture: no update()
+    def __init__(self, img):
+        self.img = np.array(img)
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+class FixedGraphics(HeadlessGraphics):
+    def newTexture(self, img):
+        self.textures.append(FixedTexture(img))
+        return self.textures[-1]
+
+
+def test_pool_updates_in_place():
+    graphics = HeadlessGraphics()
+    pool = TexturePool(graphics)
+    for value in np.linspace(0, 1, 10):
+        texture = pool.acquire(np.full((4, 6), value))
+        assert (texture.img == value).all()
+    assert len(graphics.textures) == 2
+    pool.release()
+    assert graphics.live_textures == 0
+
+
+def test_pool_uploads_into_textures_without_update():
+    graphics = FixedGraphics()
+    uploads = []
+
+    def upload(texture, img):
+        uploads.append(texture)
+        texture.img[...] = img
+
+    pool = TexturePool(graphics, upload=upload)
+    for value in np.linspace(0, 1, 10):
+        texture = pool.acquire(np.full((4, 6), value))
+        assert (texture.img == value).all()
+    assert len(graphics.textures) == 2
+    assert len(uploads) == 8
+
+
+def test_pool_replaces_textures_without_upload():
+    graphics = FixedGraphics()
+    pool = TexturePool(graphics)
+    for value in np.linspace(0, 1, 10):
+        pool.acquire(np.full((4, 6), value))
+    assert len(graphics.textures) == 10
+    assert graphics.live_textures == 2
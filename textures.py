@@ -0,0 +1,151 @@
+"""
+Texture pool for the demo's presentation path.
+
+Creating a texture per frame (and only deleting the last one) leaks GPU
+textures. A TexturePool keeps a small ring of textures per image shape and
+reuses them: a texture that supports update(img) (e.g. HeadlessTexture) is
+updated in place, hrl textures through the pool's upload (hrl_upload: the
+new pixels are uploaded into the existing GL texture). Otherwise a texture is
+replaced and the old one deleted, so the number of live textures stays
+bounded either way. trim() releases the textures of shapes that are no longer
+shown (call it on slide change); release() deletes all of them.
+
+    textures = TexturePool(hrl.graphics, upload=hrl_upload(hrl.graphics))
+
+HeadlessGraphics is a stand-in for hrl.graphics (newTexture / flip) that
+keeps textures in memory, for running and testing without a display.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+def hrl_upload(graphics):
+    # upload(texture, img) for hrl textures: rebinds the GL texture an hrl
+    # Texture wraps (_txid) and replaces its pixels with glTexSubImage2D, in
+    # the format of hrl's newTexture/loadTexture (rows flipped, grey values
+    # converted by the device to RGBA packed into uint32). None without
+    # hrl and PyOpenGL
+    try:
+        from hrl.graphics.graphics import channelsToInt
+        from OpenGL import GL as gl
+    except ImportError:
+        return None
+
+    def upload(texture, img):
+        pixels = channelsToInt(graphics.greyToChannels(np.flipud(img)))
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture._txid)
+        gl.glTexSubImage2D(
+            gl.GL_TEXTURE_2D,
+            0,
+            0,
+            0,
+            texture.wdth,
+            texture.hght,
+            gl.GL_RGBA,
+            gl.GL_UNSIGNED_INT_8_8_8_8,
+            np.ascontiguousarray(pixels, dtype=np.uint32),
+        )
+
+    return upload
+
+
+class TexturePool:
+    def __init__(self, graphics, size=2, upload=None):
+        self.graphics = graphics
+        self.size = size  # textures per shape; 2 = double buffering
+        self.upload = upload  # upload(texture, img) in place, for textures without update()
+        self._textures = OrderedDict()  # shape -> list of textures
+        self._next = {}  # shape -> index of the texture to reuse next
+        self._last_shape = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def __len__(self):
+        return sum(len(textures) for textures in self._textures.values())
+
+    def acquire(self, img):
+        # Texture showing img, reusing a pooled texture of the same shape
+        shape = np.shape(img)
+        textures = self._textures.setdefault(shape, [])
+        self._textures.move_to_end(shape)
+        self._last_shape = shape
+
+        if len(textures) < self.size:
+            textures.append(self.graphics.newTexture(img))
+            return textures[-1]
+
+        idx = self._next.get(shape, 0)
+        self._next[shape] = (idx + 1) % self.size
+        texture = textures[idx]
+        if hasattr(texture, "update"):
+            texture.update(img)
+        elif self.upload is not None:
+            self.upload(texture, img)
+        else:
+            textures[idx] = self.graphics.newTexture(img)
+            texture.delete()
+        return textures[idx]
+
+    def trim(self, keep=None):
+        # Release the textures of every shape but keep (default: last shown)
+        keep = self._last_shape if keep is None else tuple(keep)
+        for shape in [shape for shape in self._textures if shape != keep]:
+            for texture in self._textures.pop(shape):
+                texture.delete()
+            self._next.pop(shape, None)
+
+    def release(self):
+        for textures in self._textures.values():
+            for texture in textures:
+                texture.delete()
+        self._textures.clear()
+        self._next.clear()
+
+
+# %% Headless stand-in for hrl.graphics
+class HeadlessTexture:
+    def __init__(self, img):
+        self.img = np.array(img, dtype=float)
+        self.hght, self.wdth = self.img.shape[:2]
+        self.deleted = False
+        self.draws = []
+
+    def update(self, img):
+        self._check()
+        self.img[...] = img
+
+    def draw(self, pos=None, sz=None):
+        self._check()
+        self.draws.append(pos)
+
+    def delete(self):
+        self._check()
+        self.deleted = True
+
+    def _check(self):
+        if self.deleted:
+            raise RuntimeError("texture used after delete()")
+
+
+class HeadlessGraphics:
+    def __init__(self, width=1920, height=1080):
+        self.wdth, self.hght = width, height
+        self.textures = []
+        self.flips = 0
+
+    def newTexture(self, img):
+        self.textures.append(HeadlessTexture(img))
+        return self.textures[-1]
+
+    def flip(self, clr=True):
+        self.flips += 1
+
+    @property
+    def live_textures(self):
+        return sum(not texture.deleted for texture in self.textures)
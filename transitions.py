@@ -0,0 +1,130 @@
+"""
+Crossfade transitions between two images, for ecvp2024_demo.py.
+
+A Crossfade computes b - a once, then writes every frame
+    a + (b - a) * weight[t]
+into one reusable buffer with in-place ufuncs, so no full-frame temporaries
+are allocated per frame. The weights come from an easing curve. The compute
+time of every frame is recorded and can be checked against the frame budget
+(1 / rate, 16.7 ms at 60 Hz).
+
+Still is the one-frame counterpart of a Crossfade, for slides that are shown
+without transition.
+
+A Prefetcher prepares transitions in a background thread (e.g. the
+neighbours of the current slide) while the presentation waits for input.
+"""
+
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# %% Easing curves: [0, 1] -> [0, 1]
+EASINGS = {
+    "linear": lambda t: t,
+    "smoothstep": lambda t: t * t * (3 - 2 * t),
+    "cosine": lambda t: (1 - np.cos(np.pi * t)) / 2,
+    "ease_in": lambda t: t * t,
+    "ease_out": lambda t: t * (2 - t),
+}
+
+
+def fade_weights(nframes, easing="linear"):
+    if isinstance(easing, str):
+        easing = EASINGS[easing]
+    return easing(np.linspace(0, 1, nframes))
+
+
+# %% Transition engine
+class Crossfade:
+    def __init__(self, a, b, nframes, easing="linear", out=None):
+        self.a = np.asarray(a)
+        self.diff = np.subtract(b, a, dtype=float)
+        self.weights = fade_weights(nframes, easing)
+        self.out = np.empty(self.a.shape, dtype=float) if out is None else out
+        self.frame_times = np.zeros(nframes)
+
+    def __len__(self):
+        return len(self.weights)
+
+    def frame(self, t):
+        start = time.perf_counter()
+        np.multiply(self.diff, self.weights[t], out=self.out)
+        np.add(self.out, self.a, out=self.out)
+        self.frame_times[t] = time.perf_counter() - start
+        return self.out
+
+    def __iter__(self):
+        # The same buffer is yielded every frame: use it before the next one
+        for t in range(len(self)):
+            yield self.frame(t)
+
+    def timing(self, rate=60):
+        budget = 1 / rate
+        return {
+            "budget": budget,
+            "mean": self.frame_times.mean(),
+            "max": self.frame_times.max(),
+            "over_budget": int((self.frame_times > budget).sum()),
+        }
+
+
+class Still:
+    # A slide without transition: one frame showing img
+    def __init__(self, img):
+        self.img = img
+
+    def __len__(self):
+        return 1
+
+    def frame(self, t):
+        return self.img
+
+    def __iter__(self):
+        yield self.img
+
+
+def format_timing(timing):
+    return (
+        f"frame compute {timing['mean'] * 1e3:.2f} ms mean, {timing['max'] * 1e3:.2f} ms max; "
+        f"{timing['over_budget']} frames over the {timing['budget'] * 1e3:.1f} ms budget"
+    )
+
+
+# %% Prefetching
+class Prefetcher:
+    # Runs prepare(key) in the background for the keys passed to prefetch().
+    # Only the most recently requested keys are kept (at most max_items);
+    # work for keys that are no longer requested is cancelled or discarded.
+
+    def __init__(self, prepare, max_items=2):
+        self.prepare = prepare
+        self.max_items = max_items
+        self._futures = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+    def prefetch(self, keys):
+        keys = list(dict.fromkeys(keys))[: self.max_items]
+        for key in [key for key in self._futures if key not in keys]:
+            self._futures.pop(key).cancel()
+        for key in keys:
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(self.prepare, key)
+
+    def get(self, key):
+        # Prepared value for key: prefetched if available, else prepared now
+        future = self._futures.pop(key, None)
+        if future is None or future.cancelled():
+            return self.prepare(key)
+        return future.result()
+
+    def is_ready(self, key):
+        return key in self._futures and self._futures[key].done()
+
+    def close(self):
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)